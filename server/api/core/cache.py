@@ -0,0 +1,64 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from .config import settings
+from .metrics import AUTH_CACHE_LOOKUPS
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire ttl seconds after being set.
+
+    Counts hits and misses in the auth_cache_lookups metric, labelled with the
+    cache's name, so the hit ratio can be monitored.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._hits = AUTH_CACHE_LOOKUPS.labels(name, "hit")
+        self._misses = AUTH_CACHE_LOOKUPS.labels(name, "miss")
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._hits.inc()
+                    return value
+                del self._entries[key]
+            self._misses.inc()
+            return default
+
+    def set(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Decoded access tokens, by token.
+token_cache = TTLCache(
+    "token", settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL_SECONDS
+)
+# Authenticated users, by email. Invalidated by UserCrud when a user changes.
+user_cache = TTLCache("user", settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL_SECONDS)
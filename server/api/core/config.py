@@ -1,6 +1,11 @@
+import os
+import tempfile
+
 from dotenv import dotenv_values
 from pydantic import BaseSettings
 
+from .constants import IMPORT_BATCH_SIZE, MAX_IMPORT_FILE_SIZE
+
 config = dotenv_values(".env")
 
 
@@ -11,6 +16,42 @@ class Settings(BaseSettings):
 
     PROJECT_NAME: str = "Sales Automation"
 
+    # Connection pool of each engine, in every API and worker process. A process
+    # opens at most DB_POOL_SIZE + DB_MAX_OVERFLOW connections per engine.
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    # Seconds a request waits for a free connection before failing.
+    DB_POOL_TIMEOUT: float = 30
+    # Seconds after which a connection is replaced; -1 keeps them forever.
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Connect through PgBouncer in transaction pooling mode, which cannot keep
+    # prepared statements across transactions.
+    DB_PGBOUNCER: bool = False
+
+    # Per-process cache of decoded tokens and authenticated users. A size of 0
+    # disables it; the TTL bounds how long other processes can serve a stale user.
+    AUTH_CACHE_SIZE: int = 10000
+    AUTH_CACHE_TTL_SECONDS: float = 60
+
+    # bcrypt work factor. Stored hashes with another factor are rehashed on login.
+    BCRYPT_ROUNDS: int = 12
+    # Threads available to hash and verify passwords off the event loop.
+    PASSWORD_HASH_WORKERS: int = 4
+
+    # Prospect CSV imports
+    MAX_IMPORT_FILE_SIZE: int = MAX_IMPORT_FILE_SIZE
+    IMPORT_BATCH_SIZE: int = IMPORT_BATCH_SIZE
+    IMPORT_SPOOL_DIR: str = os.path.join(tempfile.gettempdir(), "prospect_imports")
+    # Processes validating the rows of each import while the worker writes them;
+    # 0 validates them in the worker process itself.
+    IMPORT_PARSE_PROCESSES: int = 0
+    IMPORT_WORKER_POLL_SECONDS: float = 1.0
+    IMPORT_JOB_STALE_SECONDS: int = 300
+    IMPORT_JOB_MAX_ATTEMPTS: int = 3
+    # Chunked uploads not finalized after this long are deleted by the workers.
+    UPLOAD_EXPIRE_SECONDS: int = 24 * 60 * 60
+
     class Config:
         case_sensitive = True
 
@@ -3,4 +3,19 @@ MIN_PAGE = 0
 DEFAULT_PAGE_SIZE = 10
 MIN_PAGE_SIZE = 1
 MAX_PAGE_SIZE = 100
-MAX_IMPORT_FILE_SIZE = 2000000
+MAX_SEARCH_RESULTS = 10
+MIN_SEARCH_LENGTH = 3
+CAMPAIGN_PROSPECTS_CHUNK_SIZE = 50000
+EXPORT_BATCH_SIZE = 1000
+MAX_IMPORT_FILE_SIZE = 500000000
+IMPORT_CHUNK_SIZE = 1024 * 1024
+IMPORT_BATCH_SIZE = 1000
+IMPORT_PARSE_RANGE_SIZE = 4 * 1024 * 1024
+IMPORT_JOB_QUEUED = "queued"
+IMPORT_JOB_RUNNING = "running"
+IMPORT_JOB_DONE = "done"
+IMPORT_JOB_FAILED = "failed"
+IMPORT_KEEP_FIRST = "first"
+IMPORT_KEEP_LAST = "last"
+FILE_PROGRESS_CHANNEL = "file_progress"
+PROGRESS_KEEPALIVE_SECONDS = 15
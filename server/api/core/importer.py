@@ -0,0 +1,371 @@
+import csv
+import hashlib
+import io
+import mmap
+import os
+import re
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import (
+    AsyncIterator,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Tuple,
+    Union,
+)
+
+from fastapi import UploadFile
+from sqlalchemy.orm.session import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+
+from api.crud import FileCrud, ProspectCrud
+from .config import settings
+from .constants import (
+    IMPORT_CHUNK_SIZE,
+    IMPORT_KEEP_FIRST,
+    IMPORT_KEEP_LAST,
+    IMPORT_PARSE_RANGE_SIZE,
+)
+
+email_pattern = re.compile(r"(^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$)")
+
+
+class RangeError(Exception):
+    """Raised when a chunk of an upload does not match its announced range"""
+
+
+class FileTooLargeError(Exception):
+    """Raised when an upload grows past the configured import size limit"""
+
+    def __init__(self, max_size: int):
+        super().__init__(f"File size cannot exceed {max_size} bytes")
+        self.max_size = max_size
+
+
+async def spool_upload(file: UploadFile, max_size: int) -> Tuple[str, int, str]:
+    """Copy an upload chunk by chunk into the spool directory.
+
+    Returns the path of the spooled copy, its size in bytes and the SHA-256 of
+    its content. Stops copying as soon as the upload exceeds max_size, so
+    oversized files are never spooled whole. Starlette has already received the
+    whole request body by then, so this does not limit what clients can send;
+    chunked uploads check their announced size before receiving any byte.
+    """
+    os.makedirs(settings.IMPORT_SPOOL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=".csv", dir=settings.IMPORT_SPOOL_DIR)
+    size = 0
+    content_hash = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as spool:
+            while True:
+                chunk = await file.read(IMPORT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise FileTooLargeError(max_size)
+                content_hash.update(chunk)
+                await run_in_threadpool(spool.write, chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, size, content_hash.hexdigest()
+
+
+def create_spool_file() -> str:
+    """Create an empty file in the spool directory for a chunked upload"""
+    os.makedirs(settings.IMPORT_SPOOL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix=".csv", dir=settings.IMPORT_SPOOL_DIR)
+    os.close(fd)
+    return path
+
+
+async def spool_range(
+    chunks: AsyncIterator[bytes], path: str, start: int, end: int
+) -> Tuple[int, str]:
+    """Write the chunks of a byte range of a chunked upload into its spooled
+    file, from start and up to end at most.
+
+    Returns how many bytes were written and their SHA-256. When the client
+    disconnects, the bytes written until then are kept and counted.
+    """
+    written = 0
+    range_hash = hashlib.sha256()
+    with open(path, "r+b") as spool:
+        spool.seek(start)
+        try:
+            async for chunk in chunks:
+                if start + written + len(chunk) > end:
+                    raise RangeError("More bytes than the Content-Range announced")
+                range_hash.update(chunk)
+                await run_in_threadpool(spool.write, chunk)
+                written += len(chunk)
+        except ClientDisconnect:
+            pass
+    return written, range_hash.hexdigest()
+
+
+def hash_file(path: str) -> str:
+    """SHA-256 of a spooled file, read a chunk at a time"""
+    file_hash = hashlib.sha256()
+    with open(path, "rb") as spooled:
+        for chunk in iter(lambda: spooled.read(IMPORT_CHUNK_SIZE), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def iter_csv_rows(path: str) -> Iterator[List[str]]:
+    """Lazily yield the rows of a spooled CSV file"""
+    with open(path, newline="", encoding="utf-8") as csv_file:
+        yield from csv.reader(csv_file)
+
+
+def count_csv_rows(path: str) -> int:
+    """Count the rows of a spooled CSV file without keeping them in memory"""
+    return sum(1 for _ in iter_csv_rows(path))
+
+
+def iter_prospects(
+    rows: Iterable[List[str]], indexes: dict, has_headers: bool
+) -> Iterator[Union[dict, None]]:
+    """Validate CSV rows, yielding the prospect data of each row or None if invalid"""
+    for i, row in enumerate(rows):
+        # Skip header row.
+        if not i and has_headers:
+            continue
+
+        # Skip any rows if the indexes are out of range.
+        num_col = len(row)
+        if any(idx >= num_col for idx in indexes.values()):
+            yield None
+            continue
+
+        email = row[indexes["email"]]
+        first_name = ""
+        last_name = ""
+
+        # Attempt to validate the email. Skip if invalid.
+        if not email_pattern.match(email):
+            yield None
+            continue
+
+        # Grab first and last name if we were given indexes.
+        if "first_name" in indexes:
+            first_name = row[indexes["first_name"]]
+        if "last_name" in indexes:
+            last_name = row[indexes["last_name"]]
+
+        yield {"email": email, "first_name": first_name, "last_name": last_name}
+
+
+def csv_record_end(csv_file, data: mmap.mmap, start: int, size: int) -> int:
+    """Offset of the first record end at least size bytes past start, where a
+    record of the spooled CSV file starts"""
+    line_break = data.find(b"\n", start + size)
+    end = line_break + 1 if line_break != -1 else len(data)
+    # Without quotes, every line break ends a record.
+    if data.find(b'"', start, end) == -1:
+        return end
+
+    # Otherwise quoted values may span lines, and quotes only open them at the
+    # start of a field, so let csv.reader tell where its records end.
+    offset = start
+
+    def lines(text: io.TextIOWrapper) -> Iterator[str]:
+        nonlocal offset
+        for line in text:
+            offset += len(line) if line.isascii() else len(line.encode("utf-8"))
+            yield line
+
+    csv_file.seek(start)
+    text = io.TextIOWrapper(csv_file, encoding="utf-8", newline="")
+    try:
+        for _ in csv.reader(lines(text)):
+            if offset - start >= size:
+                break
+    finally:
+        text.detach()
+    return offset
+
+
+def split_csv_ranges(path: str, size: int) -> Iterator[Tuple[int, int]]:
+    """Split a spooled CSV file into byte ranges of about size bytes.
+
+    Ranges end where csv.reader ends a record, so every range holds whole
+    records, even when quoted values span several lines or unquoted ones hold
+    stray quotes (O"Brien). Ranges without quotes end on the first line break
+    past their size, found without parsing them.
+    """
+    if not os.path.getsize(path):
+        return
+    with open(path, "rb") as csv_file, mmap.mmap(
+        csv_file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as data:
+        start = 0
+        while start < len(data):
+            end = csv_record_end(csv_file, data, start, size)
+            yield start, end
+            start = end
+
+
+def parse_csv_range(
+    path: str, start: int, end: int, indexes: dict, has_headers: bool
+) -> List[Union[dict, None]]:
+    """Validate the rows of a byte range of a spooled CSV file. Runs in the
+    processes of the parse pool."""
+    with open(path, "rb") as csv_file:
+        csv_file.seek(start)
+        text = csv_file.read(end - start).decode("utf-8")
+    rows = csv.reader(io.StringIO(text, newline=""))
+    return list(iter_prospects(rows, indexes, has_headers))
+
+
+def iter_prospects_parallel(
+    path: str, indexes: dict, has_headers: bool, processes: int
+) -> Iterator[Union[dict, None]]:
+    """Validate the rows of a spooled CSV file in a pool of processes, yielding
+    the same items as iter_prospects in the same order.
+
+    Ranges of the file are parsed ahead of the consumer, at most two per
+    process at a time, so parsing overlaps with writing while memory stays
+    bounded by the ranges in flight.
+    """
+    ranges = split_csv_ranges(path, IMPORT_PARSE_RANGE_SIZE)
+    pending = deque()
+    with ProcessPoolExecutor(processes) as pool:
+        try:
+            for start, end in ranges:
+                if len(pending) >= 2 * processes:
+                    yield from pending.popleft().result()
+                pending.append(
+                    pool.submit(
+                        parse_csv_range,
+                        path,
+                        start,
+                        end,
+                        indexes,
+                        # Only the first range holds the header.
+                        has_headers and start == 0,
+                    )
+                )
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """Group items into lists of at most size elements"""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def collapse_duplicates(prospects: List[dict], keep: str) -> Tuple[List[dict], int]:
+    """Keep a single prospect per email: the first one, or the last one when keep
+    is IMPORT_KEEP_LAST. Returns the prospects kept and how many were dropped."""
+    rows = {}
+    for prospect in prospects:
+        if keep == IMPORT_KEEP_LAST:
+            rows.pop(prospect["email"], None)
+            rows[prospect["email"]] = prospect
+        elif prospect["email"] not in rows:
+            rows[prospect["email"]] = prospect
+    return list(rows.values()), len(prospects) - len(rows)
+
+
+def import_prospects(
+    db: Session,
+    user_id: int,
+    file_id: int,
+    path: str,
+    indexes: dict,
+    has_headers: bool,
+    force: bool,
+    duplicates: str = IMPORT_KEEP_FIRST,
+    batch_size: int = settings.IMPORT_BATCH_SIZE,
+    on_batch: Callable[[], None] = None,
+    parse_processes: int = settings.IMPORT_PARSE_PROCESSES,
+):
+    """Import a spooled CSV file into the user's prospects.
+
+    The file is streamed through validation in batches, so only one batch of
+    rows is ever held in memory. Each batch is committed together with the
+    file's progress counters, and on_batch is called after every commit. With
+    parse_processes, rows are validated by that many processes while batches
+    are being written.
+
+    Rows repeating an email of the file are collapsed into one prospect, the
+    first or the last row winning depending on duplicates, and counted as
+    duplicates. Repeats in later batches are recognized by the emails seen so
+    far, and after a restart by their prospect already being attributed to the
+    file, so the counts do not depend on where batches split.
+
+    The file's done_rows is the checkpoint of the import: when a job is run
+    again after its worker died or failed, the rows before it were already
+    committed and are skipped, and a finished import is left untouched.
+    """
+    file = FileCrud.get_file(db, user_id, file_id)
+    if file.done_at:
+        return
+    if parse_processes > 0:
+        rows = iter_prospects_parallel(path, indexes, has_headers, parse_processes)
+    else:
+        rows = iter_prospects(iter_csv_rows(path), indexes, has_headers)
+    rows = islice(rows, file.done_rows or 0, None)
+    seen = set()
+    for batch in batched(rows, batch_size):
+        valid = [prospect for prospect in batch if prospect]
+        prospects, duplicate_rows = collapse_duplicates(valid, duplicates)
+
+        # Find which emails the user already has with one query per batch.
+        existing = ProspectCrud.get_existing_emails(
+            db, user_id, [prospect["email"] for prospect in prospects]
+        )
+        new, overwritten, repeated = [], [], []
+        for prospect in prospects:
+            email = prospect["email"]
+            if email in seen or existing.get(email) == file_id:
+                duplicate_rows += 1
+                # Only overwrite the row kept earlier if it was written at all.
+                if duplicates == IMPORT_KEEP_LAST and existing.get(email) == file_id:
+                    repeated.append(prospect)
+            elif email not in existing:
+                new.append(prospect)
+            elif force:
+                overwritten.append(prospect)
+        seen.update(prospect["email"] for prospect in prospects)
+
+        # Create new prospects, and only update existing ones when forcing.
+        inserted, _ = ProspectCrud.upsert_prospects(db, user_id, file_id, new)
+        _, updated = ProspectCrud.upsert_prospects(
+            db, user_id, file_id, overwritten, force=True
+        )
+        ProspectCrud.upsert_prospects(db, user_id, file_id, repeated, force=True)
+        FileCrud.advance_file_progress(
+            db,
+            user_id,
+            file_id,
+            {
+                "done_rows": len(batch),
+                "inserted_rows": inserted,
+                "updated_rows": updated,
+                "skipped_rows": len(valid) - duplicate_rows - inserted - updated,
+                "invalid_rows": len(batch) - len(valid),
+                "duplicate_rows": duplicate_rows,
+            },
+        )
+        if on_batch:
+            on_batch()
+
+    # Update the finished date time of file.
+    FileCrud.update_file_done_at(db, user_id, file_id)
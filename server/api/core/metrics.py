@@ -0,0 +1,173 @@
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Set by main.py when it starts several worker processes, so that each of them
+# writes its metrics there and any of them can serve the total.
+MULTIPROC_DIR_ENV = "PROMETHEUS_MULTIPROC_DIR"
+
+POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out_connections",
+    "Connections currently checked out of the pool",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+POOL_OVERFLOW = Gauge(
+    "db_pool_overflow_connections",
+    "Connections opened beyond the pool size",
+    ["engine"],
+    multiprocess_mode="livesum",
+)
+POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the pool",
+    ["engine"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+POOL_CHECKOUT_TIMEOUTS = Counter(
+    "db_pool_checkout_timeouts",
+    "Checkouts that gave up waiting for a connection",
+    ["engine"],
+)
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Time until the response starts",
+    ["method", "route", "status"],
+)
+REQUEST_SQL_STATEMENTS = Histogram(
+    "http_request_sql_statements",
+    "SQL statements run while handling a request",
+    ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+REQUEST_SQL_SECONDS = Histogram(
+    "http_request_sql_duration_seconds",
+    "Time spent running SQL statements while handling a request",
+    ["method", "route"],
+)
+
+PASSWORD_HASHING_QUEUED = Gauge(
+    "password_hashing_queued",
+    "Password hashes waiting for a thread of the hashing pool",
+    multiprocess_mode="livesum",
+)
+PASSWORD_HASHING_RUNNING = Gauge(
+    "password_hashing_running",
+    "Password hashes being computed",
+    multiprocess_mode="livesum",
+)
+PASSWORD_HASHING_WAIT_SECONDS = Histogram(
+    "password_hashing_queue_wait_seconds",
+    "Time password hashes spent waiting for a thread of the hashing pool",
+)
+
+AUTH_CACHE_LOOKUPS = Counter(
+    "auth_cache_lookups",
+    "Lookups in the authentication caches, by whether the entry was found",
+    ["cache", "result"],
+)
+
+
+class RequestStats:
+    """SQL statements run on behalf of one request"""
+
+    def __init__(self):
+        self.statements = 0
+        self.sql_seconds = 0.0
+
+
+# Stats of the request being handled, seen by the engine events of every
+# session it uses, including the async ones and those in the threadpool.
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats", default=None
+)
+
+
+def instrument_engine(engine: Engine):
+    """Count the statements run by the engine in the stats of the current request"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, many):
+        conn.info.setdefault("statement_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, many):
+        started = conn.info["statement_started"].pop()
+        stats = request_stats.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.sql_seconds += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """Records the latency, status and SQL statements of every HTTP request by
+    route.
+
+    Latency is measured until the response starts, so that streamed responses do
+    not count for as long as they stay open.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        start = time.perf_counter()
+        # Unhandled exceptions are turned into a 500 further out.
+        response = {"status": 500, "seconds": None}
+
+        async def send_with_metrics(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["seconds"] = time.perf_counter() - start
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            request_stats.reset(token)
+            if response["seconds"] is None:
+                response["seconds"] = time.perf_counter() - start
+            # The route template, not the path, keeps the number of series bounded.
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = scope["method"]
+            REQUEST_SECONDS.labels(method, route, response["status"]).observe(
+                response["seconds"]
+            )
+            REQUEST_SQL_STATEMENTS.labels(method, route).observe(stats.statements)
+            REQUEST_SQL_SECONDS.labels(method, route).observe(stats.sql_seconds)
+
+
+def render() -> bytes:
+    """Render the metrics of every worker process in the Prometheus text format"""
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead():
+    """Drop the live gauges of this process once it stops serving"""
+    if os.environ.get(MULTIPROC_DIR_ENV):
+        multiprocess.mark_process_dead(os.getpid())
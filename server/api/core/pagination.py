@@ -0,0 +1,29 @@
+import base64
+import json
+from typing import List, Union
+
+from .constants import MAX_PAGE_SIZE
+
+
+def encode_cursor(last_id: int) -> str:
+    """Build the opaque cursor pointing just after the row with id last_id"""
+    raw = json.dumps({"id": last_id}).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> int:
+    """Return the id a cursor points after. Raises ValueError if it is malformed."""
+    try:
+        last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))["id"]
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(last_id, int):
+        raise ValueError("Invalid cursor")
+    return last_id
+
+
+def next_cursor(rows: List, page_size: int) -> Union[str, None]:
+    """Cursor for the page after rows, or None when rows is the last page"""
+    if not rows or len(rows) < min(page_size, MAX_PAGE_SIZE):
+        return None
+    return encode_cursor(rows[-1].id)
@@ -0,0 +1,71 @@
+import time
+
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from .config import settings
+from .metrics import (
+    POOL_CHECKED_OUT,
+    POOL_CHECKOUT_SECONDS,
+    POOL_CHECKOUT_TIMEOUTS,
+    POOL_OVERFLOW,
+)
+
+
+class InstrumentedPool:
+    """Records how long checkouts wait and how many connections are in use.
+
+    Metrics are labelled with the pool's logging name, which survives the pool
+    being recreated when its engine is disposed.
+    """
+
+    def connect(self):
+        label = self.logging_name
+        start = time.perf_counter()
+        try:
+            conn = super().connect()
+        except TimeoutError:
+            POOL_CHECKOUT_TIMEOUTS.labels(label).inc()
+            raise
+        finally:
+            POOL_CHECKOUT_SECONDS.labels(label).observe(time.perf_counter() - start)
+        self._record_usage()
+        return conn
+
+    def _return_conn(self, record):
+        super()._return_conn(record)
+        self._record_usage()
+
+    def _record_usage(self):
+        POOL_CHECKED_OUT.labels(self.logging_name).set(self.checkedout())
+        POOL_OVERFLOW.labels(self.logging_name).set(max(self.overflow(), 0))
+
+
+class InstrumentedQueuePool(InstrumentedPool, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(InstrumentedPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def engine_options(name: str, is_async: bool = False) -> dict:
+    """Keyword arguments for create_engine sizing its pool from the settings"""
+    options = {
+        "poolclass": InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+        "pool_logging_name": name,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    if is_async and settings.DB_PGBOUNCER:
+        # Named prepared statements are cached per connection, but PgBouncer may
+        # run the next transaction on another server connection. Without the
+        # caches asyncpg falls back to unnamed statements.
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+        }
+    return options
@@ -0,0 +1,118 @@
+import asyncio
+import select
+import threading
+import time
+import traceback
+from collections import defaultdict
+from typing import Dict, Set
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+from api import schemas
+from .config import config
+from .constants import FILE_PROGRESS_CHANNEL
+
+# Seconds between checks for a stopped loop while waiting for notifications.
+LISTEN_POLL_SECONDS = 5
+# Seconds to wait before reconnecting after the listening connection fails.
+RECONNECT_SECONDS = 1
+
+
+class ProgressBroadcaster:
+    """Fans file progress notifications out to every stream watching the file.
+
+    A single connection per API process LISTENs on the progress channel, no
+    matter how many streams are open, and hands each notification to the
+    asyncio queues subscribed to that file. Notifications carry the complete
+    progress, so a slow subscriber only ever needs the latest one.
+    """
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self.subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self.loop = None
+        self.thread = None
+
+    def subscribe(self, file_id: int) -> asyncio.Queue:
+        """Return a queue receiving the progress events of the file"""
+        self._ensure_listening()
+        queue = asyncio.Queue(maxsize=1)
+        self.subscribers[file_id].add(queue)
+        return queue
+
+    def unsubscribe(self, file_id: int, queue: asyncio.Queue):
+        queues = self.subscribers.get(file_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[file_id]
+
+    def _ensure_listening(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.loop = asyncio.get_running_loop()
+        self.thread = threading.Thread(target=self._listen, daemon=True)
+        self.thread.start()
+
+    def _listen(self):
+        # Runs on its own thread, so blocking on the connection is fine here.
+        engine = create_engine(config.get("DATABASE_URL"), poolclass=NullPool)
+        while not self.loop.is_closed():
+            try:
+                conn = engine.raw_connection()
+                try:
+                    conn.set_session(autocommit=True)
+                    conn.cursor().execute(f"LISTEN {self.channel}")
+                    while not self.loop.is_closed():
+                        readable, _, _ = select.select(
+                            [conn], [], [], LISTEN_POLL_SECONDS
+                        )
+                        if not readable:
+                            continue
+                        conn.poll()
+                        while conn.notifies:
+                            payload = conn.notifies.pop(0).payload
+                            self.loop.call_soon_threadsafe(self._dispatch, payload)
+                finally:
+                    conn.close()
+            except Exception:
+                traceback.print_exc()
+                time.sleep(RECONNECT_SECONDS)
+
+    def _dispatch(self, payload: str):
+        event = schemas.FileProgressEvent.parse_raw(payload)
+        for queue in self.subscribers.get(event.file_id, ()):
+            # Replace any event the subscriber has not picked up yet.
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+
+class ProgressRate:
+    """Estimates the import rate and time remaining from successive events.
+
+    Events are shared by every stream watching the file, so each stream's
+    estimates go on a copy.
+    """
+
+    def __init__(self):
+        self.started = None
+        self.started_done = None
+
+    def update(self, event: schemas.FileProgressEvent) -> schemas.FileProgressEvent:
+        now = time.monotonic()
+        if self.started is None:
+            self.started, self.started_done = now, event.done
+            return event
+
+        elapsed = now - self.started
+        if elapsed > 0 and event.done > self.started_done:
+            rate = (event.done - self.started_done) / elapsed
+            eta = max(event.total - event.done, 0) / rate
+            return event.copy(update={"rate": rate, "eta": eta})
+        return event
+
+
+broadcaster = ProgressBroadcaster(FILE_PROGRESS_CHANNEL)
@@ -0,0 +1,4 @@
+def contains_pattern(fragment: str) -> str:
+    """Build a LIKE pattern matching values containing fragment literally"""
+    escaped = fragment.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
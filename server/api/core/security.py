@@ -1,15 +1,27 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any, Union, Optional
+from typing import Any, Callable, Union, Optional
 from jose import jwt
 from passlib.context import CryptContext
-from sqlalchemy.orm.session import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .config import settings
+from . import metrics
 from api import schemas
 from api.models import User
-from api.crud.user import UserCrud
+from api.crud import user as user_crud
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Pinning min/max to the configured work factor flags every other hash as
+# needing an update, which authenticate_user then applies.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+    bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+)
 
 ALGORITHM = "HS256"
 
@@ -20,14 +32,39 @@ def create_access_token(data: dict) -> str:
     return encoded_jwt
 
 
-def verify_password(plain_password: str, password_digest: str) -> bool:
-    """Check that hashed(plain_password) matches password_digest."""
-    return pwd_context.verify(plain_password, password_digest)
+class HashingPool:
+    """Runs password hashing on a bounded thread pool instead of the event loop.
+
+    bcrypt releases the GIL, so up to [workers] hashes run in parallel while the
+    loop keeps serving other requests; the rest wait in the pool's queue. Reports
+    the queued and running work and the time spent queueing in the
+    password_hashing_* metrics.
+    """
+
+    def __init__(self, workers: int):
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="hashing")
+
+    async def run(self, fn: Callable, *args) -> Any:
+        submitted_at = time.perf_counter()
+        metrics.PASSWORD_HASHING_QUEUED.inc()
+
+        def task():
+            metrics.PASSWORD_HASHING_QUEUED.dec()
+            metrics.PASSWORD_HASHING_WAIT_SECONDS.observe(
+                time.perf_counter() - submitted_at
+            )
+            with metrics.PASSWORD_HASHING_RUNNING.track_inprogress():
+                return fn(*args)
+
+        return await asyncio.wrap_future(self.executor.submit(task))
+
+
+hashing_pool = HashingPool(settings.PASSWORD_HASH_WORKERS)
 
 
-def get_password_hash(password: str) -> str:
-    """Return the hashed version of password"""
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    """Return the hashed version of password, computed on the hashing pool"""
+    return await hashing_pool.run(pwd_context.hash, password)
 
 
 def decode_token(token: str) -> schemas.Token:
@@ -37,16 +74,22 @@ def decode_token(token: str) -> schemas.Token:
 
 
 async def authenticate_user(
-    db: Session, email: str, password: str
+    db: AsyncSession, email: str, password: str
 ) -> Union[bool, User]:
     """Based on the provided email & password, verify that the credentials match
     the records contained in the database.
     """
-    user = UserCrud.get_user_by_email(db, email)
+    user = await user_crud.AsyncUserCrud.get_user_by_email(db, email)
     if not user:
         # No user with that email exists in the database
         return False
-    if not verify_password(password, user.password_digest):
+    verified, new_digest = await hashing_pool.run(
+        pwd_context.verify_and_update, password, user.password_digest
+    )
+    if not verified:
         # The user exists but the password was incorrect
         return False
+    if new_digest:
+        # The stored hash uses an outdated work factor
+        await user_crud.AsyncUserCrud.update_password_digest(db, user, new_digest)
     return user
@@ -0,0 +1,37 @@
+import csv
+import io
+from datetime import datetime
+from typing import Iterable, List, Sequence, Type
+
+import orjson
+from pydantic import BaseModel
+from sqlalchemy.engine import Row
+
+
+def schema_columns(model, schema: Type[BaseModel]) -> list:
+    """Columns of the model named after the fields of the schema.
+
+    Selecting them returns plain rows that serialize exactly like the schema,
+    without building ORM objects or validating them again on the way out.
+    """
+    return [getattr(model, name) for name in schema.__fields__]
+
+
+def rows_as_dicts(rows: Iterable[Row]) -> List[dict]:
+    return [row._asdict() for row in rows]
+
+
+def rows_as_csv(rows: Iterable[Sequence]) -> str:
+    """CSV lines of the rows, dates in ISO 8601 as in the JSON responses"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(
+            value.isoformat() if isinstance(value, datetime) else value for value in row
+        )
+    return buffer.getvalue()
+
+
+def rows_as_ndjson(rows: Iterable[Row]) -> bytes:
+    """One JSON object per row, each on its own line"""
+    return b"".join(orjson.dumps(row._asdict()) + b"\n" for row in rows)
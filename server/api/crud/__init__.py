@@ -1,4 +1,6 @@
-from .user import UserCrud
-from .campaign import CampaignCrud
-from .prospect import ProspectCrud
-from .file import FileCrud
+from .user import UserCrud, AsyncUserCrud
+from .campaign import CampaignCrud, AsyncCampaignCrud
+from .prospect import ProspectCrud, AsyncProspectCrud
+from .file import FileCrud, AsyncFileCrud
+from .import_job import ImportJobCrud, AsyncImportJobCrud
+from .upload import UploadCrud, AsyncUploadCrud
@@ -1,87 +1,243 @@
-from typing import List, Set, Union
-from sqlalchemy.orm.session import Session
+from typing import Iterator, List, Optional, Set, Union
+from sqlalchemy import BigInteger, cast, delete, literal, select, update
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Delete, Insert, Select, Update
 from sqlalchemy.sql.functions import func
 from api import schemas
-from api.models import Campaign, CampaignProspect
-from api.core.constants import DEFAULT_PAGE_SIZE, DEFAULT_PAGE, MIN_PAGE, MAX_PAGE_SIZE
+from api.models import Campaign, CampaignProspect, Prospect, User
+from api.core.constants import (
+    CAMPAIGN_PROSPECTS_CHUNK_SIZE,
+    DEFAULT_PAGE_SIZE,
+    DEFAULT_PAGE,
+    MIN_PAGE,
+    MAX_PAGE_SIZE,
+    MAX_SEARCH_RESULTS,
+)
+from api.core.search import contains_pattern
+from api.core.serialization import schema_columns
+from .prospect import ProspectCrud
 
-MAX_SEARCH_RESULTS = 10
+# Columns listed and searched, matching the fields of the response schema.
+CAMPAIGN_COLUMNS = schema_columns(Campaign, schemas.Campaign)
 
 
 class CampaignCrud:
     @classmethod
-    def get_users_campaign(
+    def users_campaign_query(
         cls,
-        db: Session,
         user_id: int,
         page: int = DEFAULT_PAGE,
         page_size: int = DEFAULT_PAGE_SIZE,
-    ) -> Union[List[schemas.Campaign], None]:
-        """Get user's campaigns"""
+        after_id: Optional[int] = None,
+    ) -> Select:
+        """Select one page of the user's campaigns ordered by id.
+
+        Pages are addressed by after_id (keyset pagination, constant cost at any
+        depth) or, when it is not given, by page number.
+        """
         if page < MIN_PAGE:
             page = MIN_PAGE
         if page_size > MAX_PAGE_SIZE:
             page_size = MAX_PAGE_SIZE
-        res = (
-            db.query(Campaign)
-            .filter(
+        query = select(*CAMPAIGN_COLUMNS).where(Campaign.user_id == user_id)
+        if after_id is not None:
+            query = query.where(Campaign.id > after_id)
+        else:
+            query = query.offset(page * page_size)
+        return query.order_by(Campaign.id).limit(page_size)
+
+    @classmethod
+    def total_query(cls, user_id: int, exact: bool = False) -> Select:
+        """Select the user's number of campaigns from its maintained counter, or
+        by counting the rows when exact"""
+        if exact:
+            return select(func.count(Campaign.id)).where(Campaign.user_id == user_id)
+        return select(User.campaigns_count).where(User.id == user_id)
+
+    @classmethod
+    def name_fragment_query(cls, user_id: int, name_fragment: str) -> Select:
+        """Select the user's campaigns whose name contains the fragment, most
+        similar first. The trigram GiST index on (user_id, name) returns matches
+        in order of distance (<->), so only the results are read."""
+        return (
+            select(*CAMPAIGN_COLUMNS)
+            .where(
                 Campaign.user_id == user_id,
+                Campaign.name.ilike(contains_pattern(name_fragment)),
             )
-            .offset(page * page_size)
-            .limit(page_size)
-            .all()
+            .order_by(Campaign.name.op("<->")(name_fragment), Campaign.id)
+            .limit(MAX_SEARCH_RESULTS)
         )
-        return res
 
     @classmethod
-    def get_user_campaign_total(cls, db: Session, user_id: int) -> int:
-        return db.query(Campaign).filter(Campaign.user_id == user_id).count()
+    def chunk_ids(cls, prospect_ids: Set[int]) -> Iterator[List[int]]:
+        """Split the ids in sorted chunks, so concurrent additions to a campaign
+        lock its rows in the same order"""
+        prospect_ids = sorted(prospect_ids)
+        for start in range(0, len(prospect_ids), CAMPAIGN_PROSPECTS_CHUNK_SIZE):
+            yield prospect_ids[start : start + CAMPAIGN_PROSPECTS_CHUNK_SIZE]
 
     @classmethod
-    def get_user_campaign_from_name_fragment(
-        cls, db: Session, user_id: int, name_fragment: str
-    ) -> Union[List[Campaign], None]:
+    def add_prospects_query(
+        cls, user_id: int, campaign_id: int, prospect_ids: List[int]
+    ) -> Insert:
+        """Link the user's prospects among prospect_ids to the campaign, returning
+        the ids that were not linked yet.
+
+        The ids are sent as a single array and joined to the user's prospects, so
+        ids of missing or other users' prospects are dropped in the same statement.
+        """
+        ids = (
+            func.unnest(cast(prospect_ids, ARRAY(BigInteger)))
+            .table_valued("id")
+            .render_derived("ids")
+        )
+        prospects = (
+            select(literal(campaign_id, BigInteger), Prospect.id)
+            .select_from(ids)
+            .join(Prospect, Prospect.id == ids.c.id)
+            .where(Prospect.user_id == user_id)
+        )
         return (
-            db.query(Campaign)
-            .filter(
-                Campaign.user_id == user_id, Campaign.name.ilike(f"%{name_fragment}%")
+            insert(CampaignProspect)
+            .from_select(["campaign_id", "prospect_id"], prospects)
+            .on_conflict_do_nothing(
+                constraint="uq_campaigns_prospects_campaign_id_prospect_id"
             )
-            .limit(MAX_SEARCH_RESULTS)
-            .all()
+            .returning(CampaignProspect.prospect_id)
         )
 
     @classmethod
-    def create_campaign(
-        cls, db: Session, user_id: int, data: schemas.CampaignCreate
-    ) -> Campaign:
-        """Create a user"""
-        campaign = Campaign(name=data.name, user_id=user_id)
-        db.add(campaign)
-        db.commit()
-        db.refresh(campaign)
-        return campaign
+    def add_selected_query(
+        cls, user_id: int, campaign_id: int, selector: schemas.ProspectSelector
+    ) -> Insert:
+        """Link the user's prospects matched by the selector to the campaign,
+        skipping those already linked"""
+        selected = ProspectCrud.selector_query(user_id, selector).subquery()
+        return (
+            insert(CampaignProspect)
+            .from_select(
+                ["campaign_id", "prospect_id"],
+                select(literal(campaign_id, BigInteger), selected.c.id),
+            )
+            .on_conflict_do_nothing(
+                constraint="uq_campaigns_prospects_campaign_id_prospect_id"
+            )
+        )
 
     @classmethod
-    def get_existing_campaign_prospects(cls, db: Session, campaign_id: int) -> Set[int]:
-        res = (
-            db.query(CampaignProspect.prospect_id)
-            .filter(CampaignProspect.campaign_id == campaign_id)
-            .all()
+    def remove_selected_query(
+        cls, user_id: int, campaign_id: int, selector: schemas.ProspectSelector
+    ) -> Delete:
+        """Unlink the user's prospects matched by the selector from the campaign"""
+        return (
+            delete(CampaignProspect)
+            .where(
+                CampaignProspect.campaign_id == campaign_id,
+                CampaignProspect.prospect_id.in_(
+                    ProspectCrud.selector_query(user_id, selector)
+                ),
+            )
+            .execution_options(synchronize_session=False)
         )
-        return {row.prospect_id for row in res}
 
     @classmethod
-    def add_prospects_to_campaign(
-        cls, db: Session, campaign_id: int, prospect_ids: Set[int]
-    ):
-        links = [
-            CampaignProspect(campaign_id=campaign_id, prospect_id=prospect_id)
-            for prospect_id in prospect_ids
-        ]
-        db.add_all(links)
-        db.commit()
+    def prospects_count_query(cls, campaign_id: int, count: int) -> Update:
+        """Add count to the campaign's maintained number of prospects"""
+        return (
+            update(Campaign)
+            .where(Campaign.id == campaign_id)
+            .values(prospects_count=Campaign.prospects_count + count)
+        )
+
+    @classmethod
+    def by_id_query(cls, campaign_id: int) -> Select:
+        return select(Campaign).where(Campaign.id == campaign_id)
+
+
+class AsyncCampaignCrud:
+    """CampaignCrud for async routes, sharing its queries"""
+
+    @classmethod
+    async def get_users_campaign(
+        cls,
+        db: AsyncSession,
+        user_id: int,
+        page: int = DEFAULT_PAGE,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        after_id: Optional[int] = None,
+    ) -> List[Row]:
+        """Get user's campaigns"""
+        query = CampaignCrud.users_campaign_query(user_id, page, page_size, after_id)
+        return (await db.execute(query)).all()
+
+    @classmethod
+    async def get_user_campaign_total(
+        cls, db: AsyncSession, user_id: int, exact: bool = False
+    ) -> int:
+        return (await db.execute(CampaignCrud.total_query(user_id, exact))).scalar()
+
+    @classmethod
+    async def get_user_campaign_from_name_fragment(
+        cls, db: AsyncSession, user_id: int, name_fragment: str
+    ) -> List[Row]:
+        query = CampaignCrud.name_fragment_query(user_id, name_fragment)
+        return (await db.execute(query)).all()
 
     @classmethod
-    def get_by_id(cls, db: Session, campaign_id: int) -> Union[Campaign, None]:
-        """Get a single user by id"""
-        return db.query(Campaign).filter(Campaign.id == campaign_id).one_or_none()
+    async def add_prospects_to_campaign(
+        cls, db: AsyncSession, user_id: int, campaign_id: int, prospect_ids: Set[int]
+    ) -> List[int]:
+        """Add the user's prospects to the campaign and return the ids added.
+
+        Large payloads are inserted in chunks, all in one transaction.
+        """
+        added = []
+        for chunk in CampaignCrud.chunk_ids(prospect_ids):
+            query = CampaignCrud.add_prospects_query(user_id, campaign_id, chunk)
+            added += (await db.execute(query)).scalars().all()
+        await db.execute(CampaignCrud.prospects_count_query(campaign_id, len(added)))
+        await db.commit()
+        return added
+
+    @classmethod
+    async def get_by_id(
+        cls, db: AsyncSession, campaign_id: int
+    ) -> Union[Campaign, None]:
+        """Get a single campaign by id"""
+        query = CampaignCrud.by_id_query(campaign_id)
+        return (await db.execute(query)).scalar_one_or_none()
+
+    @classmethod
+    async def add_selected_to_campaign(
+        cls,
+        db: AsyncSession,
+        user_id: int,
+        campaign_id: int,
+        selector: schemas.ProspectSelector,
+    ) -> int:
+        """Add the user's prospects matched by the selector to the campaign and
+        return how many were not in it yet"""
+        query = CampaignCrud.add_selected_query(user_id, campaign_id, selector)
+        added = (await db.execute(query)).rowcount
+        await db.execute(CampaignCrud.prospects_count_query(campaign_id, added))
+        await db.commit()
+        return added
+
+    @classmethod
+    async def remove_selected_from_campaign(
+        cls,
+        db: AsyncSession,
+        user_id: int,
+        campaign_id: int,
+        selector: schemas.ProspectSelector,
+    ) -> int:
+        """Remove the user's prospects matched by the selector from the campaign
+        and return how many were in it"""
+        query = CampaignCrud.remove_selected_query(user_id, campaign_id, selector)
+        removed = (await db.execute(query)).rowcount
+        await db.execute(CampaignCrud.prospects_count_query(campaign_id, -removed))
+        await db.commit()
+        return removed
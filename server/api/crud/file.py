@@ -1,58 +1,160 @@
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm.session import Session
+from sqlalchemy.sql import Select
 from sqlalchemy.sql.functions import func
 from api import schemas
-from api.models import File, Prospect
+from api.core.constants import (
+    FILE_PROGRESS_CHANNEL,
+    IMPORT_JOB_QUEUED,
+    IMPORT_JOB_RUNNING,
+)
+from api.models import File, ImportJob
 from typing import Union
+from .import_job import ImportJobCrud
 
 
 class FileCrud:
     @classmethod
-    def create_file(cls, db: Session, user_id: int, data: schemas.FileCreate) -> File:
+    def get_file(
+        cls,
+        db: Session,
+        user_id: int,
+        file_id: int,
+    ) -> File:
+        return db.execute(cls.file_query(user_id, file_id)).scalar_one_or_none()
+
+    @classmethod
+    def file_query(cls, user_id: int, file_id: int) -> Select:
+        return select(File).where(File.user_id == user_id, File.id == file_id)
+
+    @classmethod
+    def imported_file_query(
+        cls, user_id: int, content_hash: str, options: dict, stale_after_seconds: int
+    ) -> Select:
+        """Select the user's latest file with this content imported with these
+        options, or still being imported: queued, or running with a worker that
+        has not gone silent. Files whose import failed or was abandoned can be
+        imported again."""
+        return (
+            select(File)
+            .join(ImportJob, ImportJob.file_id == File.id)
+            .where(
+                File.user_id == user_id,
+                File.content_hash == content_hash,
+                ImportJob.options == options,
+                or_(
+                    File.done_at.isnot(None),
+                    ImportJob.status == IMPORT_JOB_QUEUED,
+                    (ImportJob.status == IMPORT_JOB_RUNNING)
+                    & ~ImportJobCrud.stale_condition(stale_after_seconds),
+                ),
+            )
+            .order_by(File.id.desc())
+            .limit(1)
+        )
+
+    @classmethod
+    def to_progress(cls, file: File) -> schemas.FileProgressResponse:
+        return schemas.FileProgressResponse(
+            total=file.total_rows,
+            done=file.done_rows,
+            inserted=file.inserted_rows,
+            updated=file.updated_rows,
+            skipped=file.skipped_rows,
+            invalid=file.invalid_rows,
+            duplicates=file.duplicate_rows,
+            done_at=file.done_at,
+        )
+
+    @classmethod
+    def advance_file_progress(cls, db: Session, user_id: int, file_id: int, data: dict):
+        """Add the row counts of an imported batch to the file and commit.
+
+        Called in the same transaction as the batch's writes, so the counters
+        always match what has been committed.
+        """
+        cls._update_and_publish(
+            db,
+            user_id,
+            file_id,
+            {
+                File.done_rows: File.done_rows + data["done_rows"],
+                File.inserted_rows: File.inserted_rows + data["inserted_rows"],
+                File.updated_rows: File.updated_rows + data["updated_rows"],
+                File.skipped_rows: File.skipped_rows + data["skipped_rows"],
+                File.invalid_rows: File.invalid_rows + data["invalid_rows"],
+                File.duplicate_rows: File.duplicate_rows + data["duplicate_rows"],
+            },
+        )
+
+    @classmethod
+    def update_file_done_at(cls, db: Session, user_id: int, file_id: int):
+        cls._update_and_publish(db, user_id, file_id, {File.done_at: func.now()})
+
+    @classmethod
+    def _update_and_publish(cls, db: Session, user_id: int, file_id: int, values: dict):
+        """Update the file, then commit along with a NOTIFY of its new progress.
+
+        Postgres only delivers the notification once the transaction commits, so
+        listeners never see progress that could still be rolled back.
+        """
+        file = db.execute(
+            update(File)
+            .where(File.user_id == user_id, File.id == file_id)
+            .values(values)
+            .returning(File.__table__)
+        ).one()
+        event = schemas.FileProgressEvent(
+            file_id=file_id, **cls.to_progress(file).dict()
+        )
+        db.execute(select(func.pg_notify(FILE_PROGRESS_CHANNEL, event.json())))
+        db.commit()
+
+
+class AsyncFileCrud:
+    """FileCrud for async routes, sharing its queries"""
+
+    @classmethod
+    async def create_file(
+        cls, db: AsyncSession, user_id: int, data: schemas.FileCreate
+    ) -> File:
+        """Add a file, flushed to get its id. The caller commits."""
         file = File(
             filename=data["filename"],
             file_size=data["file_size"],
             total_rows=data["total_rows"],
+            content_hash=data.get("content_hash"),
             user_id=user_id,
         )
         db.add(file)
-        db.commit()
-        db.refresh(file)
+        await db.flush()
         return file
 
     @classmethod
-    def get_file(
+    async def get_file(cls, db: AsyncSession, user_id: int, file_id: int) -> File:
+        query = FileCrud.file_query(user_id, file_id)
+        return (await db.execute(query)).scalar_one_or_none()
+
+    @classmethod
+    async def get_imported_file(
         cls,
-        db: Session,
+        db: AsyncSession,
         user_id: int,
-        file_id: int,
-    ) -> File:
-        return (
-            db.query(File)
-            .filter(File.user_id == user_id)
-            .filter(File.id == file_id)
-            .one_or_none()
+        content_hash: str,
+        options: dict,
+        stale_after_seconds: int,
+    ) -> Union[File, None]:
+        query = FileCrud.imported_file_query(
+            user_id, content_hash, options, stale_after_seconds
         )
+        return (await db.execute(query)).scalar_one_or_none()
 
     @classmethod
-    def get_file_progress(
-        cls, db: Session, user_id: int, file_id: int
+    async def get_file_progress(
+        cls, db: AsyncSession, user_id: int, file_id: int
     ) -> Union[schemas.FileProgressResponse, None]:
-        file = cls.get_file(db, user_id, file_id)
+        file = await cls.get_file(db, user_id, file_id)
         if not file:
             return None
-         done_rows = (
-               db.query(Prospect)
-               .filter(Prospect.user_id == user_id)
-               .filter(Prospect.file_id == file_id)
-               .count()
-         )
-
-         return schemas.FileProgressResponse(
-               total=file.total_rows, done=done_rows, done_at=file.done_at
-         )
-
-    @classmethod
-    def update_file_done_at(cls, db: Session, user_id: int, file_id: int):
-        file = cls.get_file(db, user_id, file_id)
-        file.done_at = func.now()
-        db.commit()
+        return FileCrud.to_progress(file)
@@ -0,0 +1,122 @@
+from datetime import timedelta
+from typing import List, Union
+from sqlalchemy import or_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.session import Session
+from sqlalchemy.sql.functions import func
+from api.models import ImportJob
+from api.core.constants import (
+    IMPORT_JOB_DONE,
+    IMPORT_JOB_FAILED,
+    IMPORT_JOB_QUEUED,
+    IMPORT_JOB_RUNNING,
+)
+
+
+class ImportJobCrud:
+    @classmethod
+    def stale_condition(cls, stale_after_seconds: int):
+        """Whether a job is running but its worker went silent, so presumably died"""
+        stale_before = func.now() - timedelta(seconds=stale_after_seconds)
+        return (ImportJob.status == IMPORT_JOB_RUNNING) & (
+            ImportJob.heartbeat_at < stale_before
+        )
+
+    @classmethod
+    def claim_next(
+        cls, db: Session, stale_after_seconds: int, max_attempts: int
+    ) -> Union[ImportJob, None]:
+        """Claim the oldest queued job, or a running one whose worker went silent.
+
+        SKIP LOCKED lets any number of workers poll concurrently without ever
+        claiming the same job twice. Jobs whose worker keeps dying are given up
+        on after max_attempts (see fail_abandoned).
+        """
+        job = (
+            db.query(ImportJob)
+            .filter(
+                or_(
+                    ImportJob.status == IMPORT_JOB_QUEUED,
+                    cls.stale_condition(stale_after_seconds)
+                    & (ImportJob.attempts < max_attempts),
+                )
+            )
+            .order_by(ImportJob.id)
+            .limit(1)
+            .with_for_update(skip_locked=True)
+            .one_or_none()
+        )
+        if not job:
+            db.rollback()
+            return None
+
+        job.status = IMPORT_JOB_RUNNING
+        job.attempts += 1
+        job.heartbeat_at = func.now()
+        job.updated_at = func.now()
+        db.commit()
+        db.refresh(job)
+        return job
+
+    @classmethod
+    def heartbeat(cls, db: Session, job: ImportJob):
+        """Let other workers know the job is still being worked on"""
+        job.heartbeat_at = func.now()
+        db.commit()
+
+    @classmethod
+    def mark_done(cls, db: Session, job: ImportJob):
+        job.status = IMPORT_JOB_DONE
+        job.error = None
+        job.updated_at = func.now()
+        db.commit()
+
+    @classmethod
+    def fail_abandoned(
+        cls, db: Session, stale_after_seconds: int, max_attempts: int
+    ) -> List[str]:
+        """Mark failed the jobs whose worker went silent during their last attempt,
+        which would otherwise stay running forever, returning the paths of their
+        spooled files"""
+        paths = db.execute(
+            update(ImportJob)
+            .where(
+                cls.stale_condition(stale_after_seconds),
+                ImportJob.attempts >= max_attempts,
+            )
+            .values(
+                status=IMPORT_JOB_FAILED,
+                error="The worker stopped responding during the last attempt",
+                updated_at=func.now(),
+            )
+            .returning(ImportJob.path)
+            .execution_options(synchronize_session=False)
+        ).scalars()
+        paths = list(paths)
+        db.commit()
+        return paths
+
+    @classmethod
+    def mark_failed(cls, db: Session, job: ImportJob, error: str, max_attempts: int):
+        """Record a failed attempt, re-queueing the job until it runs out of attempts"""
+        job.status = (
+            IMPORT_JOB_FAILED if job.attempts >= max_attempts else IMPORT_JOB_QUEUED
+        )
+        job.error = error
+        job.updated_at = func.now()
+        db.commit()
+
+
+class AsyncImportJobCrud:
+    """ImportJobCrud for async routes"""
+
+    @classmethod
+    async def enqueue(
+        cls, db: AsyncSession, user_id: int, file_id: int, path: str, options: dict
+    ) -> ImportJob:
+        """Queue a spooled file to be imported by a worker once the caller
+        commits"""
+        job = ImportJob(user_id=user_id, file_id=file_id, path=path, options=options)
+        db.add(job)
+        await db.flush()
+        return job
@@ -1,101 +1,285 @@
-from typing import List, Set, Union
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from sqlalchemy import String, any_, cast, or_, select, union_all
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm.session import Session
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.expression import literal_column
+from sqlalchemy.sql.functions import func
 from api import schemas
-from api.models import File, Prospect
-from api.core.constants import DEFAULT_PAGE_SIZE, DEFAULT_PAGE, MIN_PAGE, MAX_PAGE_SIZE
+from api.models import CampaignProspect, Prospect, User
+from api.core.constants import (
+    DEFAULT_PAGE_SIZE,
+    DEFAULT_PAGE,
+    MIN_PAGE,
+    MAX_PAGE_SIZE,
+    MAX_SEARCH_RESULTS,
+    EXPORT_BATCH_SIZE,
+)
+from api.core.search import contains_pattern
+from api.core.serialization import schema_columns
+
+# Columns listed and searched, matching the fields of the response schema.
+PROSPECT_COLUMNS = schema_columns(Prospect, schemas.Prospect)
 
 
 class ProspectCrud:
     @classmethod
-    def get_users_prospects(
+    def users_prospects_query(
         cls,
-        db: Session,
         user_id: int,
         page: int = DEFAULT_PAGE,
         page_size: int = DEFAULT_PAGE_SIZE,
-    ) -> Union[List[Prospect], None]:
-        """Get user's prospects"""
+        after_id: Optional[int] = None,
+    ) -> Select:
+        """Select one page of the user's prospects ordered by id.
+
+        Pages are addressed by after_id (keyset pagination, constant cost at any
+        depth) or, when it is not given, by page number.
+        """
         if page < MIN_PAGE:
             page = MIN_PAGE
         if page_size > MAX_PAGE_SIZE:
             page_size = MAX_PAGE_SIZE
+        query = select(*PROSPECT_COLUMNS).where(Prospect.user_id == user_id)
+        if after_id is not None:
+            query = query.where(Prospect.id > after_id)
+        else:
+            query = query.offset(page * page_size)
+        return query.order_by(Prospect.id).limit(page_size)
+
+    @classmethod
+    def search_condition(cls, query: str):
+        """Whether the prospect's email or name contains the query. Served by the
+        trigram indexes on each searched column."""
+        pattern = contains_pattern(query)
+        return or_(
+            Prospect.email.ilike(pattern),
+            Prospect.first_name.ilike(pattern),
+            Prospect.last_name.ilike(pattern),
+        )
+
+    @classmethod
+    def search_query(cls, user_id: int, query: str) -> Select:
+        """Select the user's prospects whose email or name contains the query,
+        the most similar matching field first.
+
+        Each column's trigram GiST index returns its matches in order of distance
+        (<->), so only the first MAX_SEARCH_RESULTS of each are read and ranked,
+        however many rows match.
+        """
+        pattern = contains_pattern(query)
+        candidates = union_all(
+            *(
+                select(Prospect.id, column.op("<->")(query).label("distance"))
+                .where(Prospect.user_id == user_id, column.ilike(pattern))
+                .order_by(column.op("<->")(query))
+                .limit(MAX_SEARCH_RESULTS)
+                for column in (Prospect.email, Prospect.first_name, Prospect.last_name)
+            )
+        ).subquery()
+        best = (
+            select(candidates.c.id, func.min(candidates.c.distance).label("distance"))
+            .group_by(candidates.c.id)
+            .subquery()
+        )
         return (
-            db.query(Prospect)
-            .filter(Prospect.user_id == user_id)
-            .offset(page * page_size)
-            .limit(page_size)
-            .all()
+            select(*PROSPECT_COLUMNS)
+            .join(best, best.c.id == Prospect.id)
+            .order_by(best.c.distance, Prospect.id)
+            .limit(MAX_SEARCH_RESULTS)
         )
 
     @classmethod
-    def get_user_prospects_total(cls, db: Session, user_id: int) -> int:
-        return db.query(Prospect).filter(Prospect.user_id == user_id).count()
+    def filter_query(
+        cls,
+        query: Select,
+        file_id: Optional[int] = None,
+        campaign_id: Optional[int] = None,
+        search: Optional[str] = None,
+    ) -> Select:
+        """Restrict a prospect query to the given file, campaign and search"""
+        if file_id is not None:
+            query = query.where(Prospect.file_id == file_id)
+        if campaign_id is not None:
+            query = query.where(
+                Prospect.id.in_(
+                    select(CampaignProspect.prospect_id).where(
+                        CampaignProspect.campaign_id == campaign_id
+                    )
+                )
+            )
+        if search is not None:
+            query = query.where(cls.search_condition(search))
+        return query
 
     @classmethod
-    def create_prospect(
-        cls, db: Session, user_id: int, data: schemas.ProspectCreate
-    ) -> Prospect:
-        """Create a prospect"""
-        prospect = Prospect(**data, user_id=user_id)
-        db.add(prospect)
-        db.commit()
-        db.refresh(prospect)
-        return prospect
+    def selector_query(cls, user_id: int, selector: schemas.ProspectSelector) -> Select:
+        """Select the ids of the user's prospects matched by the selector"""
+        return cls.filter_query(
+            select(Prospect.id).where(Prospect.user_id == user_id),
+            selector.file_id,
+            selector.campaign_id,
+            selector.query,
+        )
 
     @classmethod
-    def update_prospect(cls, db: Session, user_id: int, data: schemas.ProspectCreate):
-        res = (
-            db.query(Prospect)
-            .filter(Prospect.email == data["email"])
-            .filter(Prospect.user_id == user_id)
-            .first()
+    def export_query(
+        cls,
+        user_id: int,
+        file_id: Optional[int] = None,
+        campaign_id: Optional[int] = None,
+    ) -> Select:
+        """Select all the user's prospects, optionally from one file or campaign,
+        ordered by id and fetched EXPORT_BATCH_SIZE rows at a time from a
+        server-side cursor"""
+        query = cls.filter_query(
+            select(*PROSPECT_COLUMNS).where(Prospect.user_id == user_id),
+            file_id,
+            campaign_id,
+        )
+        return query.order_by(Prospect.id).execution_options(
+            yield_per=EXPORT_BATCH_SIZE
         )
 
-        res.first_name = data["first_name"]
-        res.last_name = data["last_name"]
+    @classmethod
+    def total_query(cls, user_id: int, exact: bool = False) -> Select:
+        """Select the user's number of prospects from its maintained counter, or
+        by counting the rows when exact"""
+        if exact:
+            return select(func.count(Prospect.id)).where(Prospect.user_id == user_id)
+        return select(User.prospects_count).where(User.id == user_id)
 
-        db.commit()
+    @classmethod
+    def add_to_user_total(cls, db: Session, user_id: int, count: int):
+        """Adjust the user's prospect counter in the current transaction"""
+        if count:
+            db.query(User).filter(User.id == user_id).update(
+                {User.prospects_count: User.prospects_count + count},
+                synchronize_session=False,
+            )
 
     @classmethod
-    def update_prospect_file(
-        cls, db: Session, user_id: int, prospect_id: int, file_id: int
-    ):
-        prospect = (
-            db.query(Prospect)
-            .filter(Prospect.user_id == user_id)
-            .filter(Prospect.id == prospect_id)
-            .one_or_none()
-        )
+    def upsert_prospects(
+        cls,
+        db: Session,
+        user_id: int,
+        file_id: int,
+        prospects: List[schemas.ProspectCreate],
+        force: bool = False,
+    ) -> Tuple[int, int]:
+        """Write a batch of prospects with a single INSERT ... ON CONFLICT.
+
+        New prospects are attributed to the file. Existing prospects (same user
+        and email) are only overwritten and re-attributed when forcing. Returns
+        the number of prospects inserted and updated. The caller commits.
+        """
+        # A statement cannot touch the same row twice, so collapse repeated
+        # emails the same way row-by-row processing would: the first one wins
+        # unless forcing, in which case later rows overwrite earlier ones.
+        rows = {}
+        for prospect in prospects:
+            if force or prospect["email"] not in rows:
+                rows[prospect["email"]] = prospect
+        if not rows:
+            return 0, 0
 
-        file = (
-            db.query(File)
-            .filter(File.user_id == user_id)
-            .filter(File.id == file_id)
-            .one_or_none()
+        stmt = insert(Prospect).values(
+            [
+                {
+                    "email": row["email"],
+                    "first_name": row["first_name"],
+                    "last_name": row["last_name"],
+                    "user_id": user_id,
+                    "file_id": file_id,
+                }
+                for row in rows.values()
+            ]
         )
+        conflict_target = [Prospect.user_id, Prospect.email]
+        if force:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=conflict_target,
+                set_={
+                    "first_name": stmt.excluded.first_name,
+                    "last_name": stmt.excluded.last_name,
+                    "file_id": stmt.excluded.file_id,
+                    "updated_at": func.now(),
+                },
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=conflict_target)
 
-        if prospect and file:
-            prospect.file_id = file_id
+        # xmax is only zero for rows this statement inserted rather than updated.
+        inserted_flags = db.execute(
+            stmt.returning(literal_column("xmax = 0"))
+        ).scalars()
+        inserted = updated = 0
+        for was_inserted in inserted_flags:
+            if was_inserted:
+                inserted += 1
+            else:
+                updated += 1
+        cls.add_to_user_total(db, user_id, inserted)
+        return inserted, updated
 
     @classmethod
-    def get_user_prospect_email(cls, db: Session, user_id: int, email: str) -> Prospect:
-        """Get a prospect"""
-        return (
-            db.query(Prospect)
-            .filter(Prospect.user_id == user_id)
-            .filter(Prospect.email == email)
-            .one_or_none()
+    def existing_emails_query(cls, user_id: int, emails: List[str]) -> Select:
+        return select(Prospect.email, Prospect.file_id).where(
+            Prospect.user_id == user_id,
+            Prospect.email == any_(cast(emails, ARRAY(String))),
         )
 
     @classmethod
-    def validate_prospect_ids(
-        cls, db: Session, user_id: int, unvalidated_prospect_ids: Set[int]
-    ) -> Set[int]:
-        res = (
-            db.query(Prospect.id)
-            .filter(
-                Prospect.user_id == user_id, Prospect.id.in_(unvalidated_prospect_ids)
-            )
-            .all()
-        )
-        return {row.id for row in res}
+    def get_existing_emails(
+        cls, db: Session, user_id: int, emails: List[str]
+    ) -> Dict[str, Optional[int]]:
+        """Map the emails the user already has a prospect for to the id of the
+        file the prospect was last imported from, with a single query"""
+        if not emails:
+            return {}
+        rows = db.execute(cls.existing_emails_query(user_id, emails))
+        return dict(rows.all())
+
+
+class AsyncProspectCrud:
+    """ProspectCrud for async routes, sharing its queries"""
+
+    @classmethod
+    async def get_users_prospects(
+        cls,
+        db: AsyncSession,
+        user_id: int,
+        page: int = DEFAULT_PAGE,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        after_id: Optional[int] = None,
+    ) -> List[Row]:
+        """Get user's prospects"""
+        query = ProspectCrud.users_prospects_query(user_id, page, page_size, after_id)
+        return (await db.execute(query)).all()
+
+    @classmethod
+    async def search_user_prospects(
+        cls, db: AsyncSession, user_id: int, query: str
+    ) -> List[Row]:
+        return (await db.execute(ProspectCrud.search_query(user_id, query))).all()
+
+    @classmethod
+    async def stream_user_prospects(
+        cls,
+        db: AsyncSession,
+        user_id: int,
+        file_id: Optional[int] = None,
+        campaign_id: Optional[int] = None,
+    ) -> AsyncIterator[List[Row]]:
+        """Yield the user's prospects in batches, holding one batch in memory"""
+        query = ProspectCrud.export_query(user_id, file_id, campaign_id)
+        async for rows in (await db.stream(query)).partitions():
+            yield rows
+
+    @classmethod
+    async def get_user_prospects_total(
+        cls, db: AsyncSession, user_id: int, exact: bool = False
+    ) -> int:
+        return (await db.execute(ProspectCrud.total_query(user_id, exact))).scalar()
@@ -0,0 +1,94 @@
+from datetime import timedelta
+from typing import List, Union
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.session import Session
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.functions import func
+from api import schemas
+from api.models import Upload
+
+
+class UploadCrud:
+    @classmethod
+    def upload_query(cls, user_id: int, upload_id: int) -> Select:
+        return select(Upload).where(Upload.user_id == user_id, Upload.id == upload_id)
+
+    @classmethod
+    def delete_expired(cls, db: Session, expire_after_seconds: int) -> List[str]:
+        """Delete the uploads never finalized and untouched for expire_after_seconds,
+        returning the paths of their spooled files"""
+        expired_before = func.now() - timedelta(seconds=expire_after_seconds)
+        paths = db.execute(
+            delete(Upload)
+            .where(Upload.file_id.is_(None), Upload.updated_at < expired_before)
+            .returning(Upload.path)
+            .execution_options(synchronize_session=False)
+        ).scalars()
+        paths = list(paths)
+        db.commit()
+        return paths
+
+
+class AsyncUploadCrud:
+    """UploadCrud for async routes, sharing its queries"""
+
+    @classmethod
+    async def create_upload(
+        cls, db: AsyncSession, user_id: int, data: schemas.UploadCreate, path: str
+    ) -> Upload:
+        upload = Upload(
+            user_id=user_id,
+            filename=data.filename,
+            size=data.size,
+            checksum=data.sha256 and data.sha256.lower(),
+            path=path,
+        )
+        db.add(upload)
+        await db.commit()
+        await db.refresh(upload)
+        return upload
+
+    @classmethod
+    async def get_upload(
+        cls, db: AsyncSession, user_id: int, upload_id: int, for_update: bool = False
+    ) -> Union[Upload, None]:
+        """Get the user's upload, locked until the transaction ends when
+        for_update, so that concurrent requests handle it one at a time"""
+        query = UploadCrud.upload_query(user_id, upload_id)
+        if for_update:
+            query = query.with_for_update()
+        return (await db.execute(query)).scalar_one_or_none()
+
+    @classmethod
+    async def advance_received(
+        cls, db: AsyncSession, upload: Upload, end: int
+    ) -> Upload:
+        """Record that the bytes up to end were written. Never moves backwards, so
+        a chunk sent again after a disconnect does not lose later ones."""
+        received = (
+            await db.execute(
+                update(Upload)
+                .where(Upload.id == upload.id)
+                .values(
+                    received=func.greatest(Upload.received, end), updated_at=func.now()
+                )
+                .returning(Upload.received)
+                .execution_options(synchronize_session=False)
+            )
+        ).scalar_one()
+        await db.commit()
+        upload.received = received
+        return upload
+
+    @classmethod
+    async def set_file(cls, db: AsyncSession, upload: Upload, file_id: int):
+        """Mark the upload as finalized into the import of file_id"""
+        upload.file_id = file_id
+        upload.updated_at = func.now()
+        await db.commit()
+
+    @classmethod
+    async def delete_upload(cls, db: AsyncSession, upload: Upload):
+        await db.delete(upload)
+        await db.commit()
@@ -1,27 +1,58 @@
 from typing import Union
 from fastapi.param_functions import Depends
 from pydantic.networks import EmailStr
-from sqlalchemy.orm.session import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.functions import func
 from api import schemas
 from api.core import security
+from api.core.cache import user_cache
 from api.dependencies.db import get_db
 from api.models import User
 
 
 class UserCrud:
     @classmethod
-    def get_user_by_email(cls, db: Session, email: EmailStr) -> Union[User, None]:
+    def by_email_query(cls, email: EmailStr) -> Select:
+        return select(User).where(User.email == email.lower())
+
+    @classmethod
+    def invalidate_cached_user(cls, email: str):
+        """Drop the user from this process' auth cache. Call whenever a user changes."""
+        user_cache.pop(email.lower())
+
+
+class AsyncUserCrud:
+    """UserCrud for async routes, sharing its queries"""
+
+    @classmethod
+    async def get_user_by_email(
+        cls, db: AsyncSession, email: EmailStr
+    ) -> Union[User, None]:
         """Get a single user by email"""
-        return db.query(User).filter(User.email == email.lower()).one_or_none()
+        return (await db.execute(UserCrud.by_email_query(email))).scalar_one_or_none()
 
     @classmethod
-    def create_user(cls, db: Session, data: schemas.UserCreate) -> User:
+    async def create_user(cls, db: AsyncSession, data: schemas.UserCreate) -> User:
         """Create a user"""
         user = User(
             email=data.email.lower(),
-            password_digest=security.get_password_hash(data.password),
+            password_digest=await security.get_password_hash(data.password),
         )
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
+        UserCrud.invalidate_cached_user(user.email)
         return user
+
+    @classmethod
+    async def update_password_digest(
+        cls, db: AsyncSession, user: User, password_digest: str
+    ):
+        """Replace the user's stored password hash"""
+        user.password_digest = password_digest
+        user.updated_at = func.now()
+        await db.commit()
+        await db.refresh(user)
+        UserCrud.invalidate_cached_user(user.email)
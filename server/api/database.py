@@ -1,11 +1,31 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from dotenv import dotenv_values
 
+from api.core.metrics import instrument_engine
+from api.core.pool import engine_options
+
 config = dotenv_values(".env")
 
-engine = create_engine(config.get("DATABASE_URL"))
+engine = create_engine(config.get("DATABASE_URL"), **engine_options("sync"))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+instrument_engine(engine)
+
+# Same database through asyncpg, for the async routes. Objects are not expired on
+# commit since an async session cannot lazy load them again afterwards.
+async_engine = create_async_engine(
+    make_url(config.get("DATABASE_URL")).set(drivername="postgresql+asyncpg"),
+    **engine_options("async", is_async=True),
+)
+instrument_engine(async_engine.sync_engine)
+AsyncSessionLocal = sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
 Base = declarative_base()
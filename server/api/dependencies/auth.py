@@ -1,6 +1,6 @@
 from fastapi import Depends
 from fastapi.security.utils import get_authorization_scheme_param
-from sqlalchemy.orm.session import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.requests import Request
 from pydantic.networks import EmailStr
 
@@ -8,9 +8,10 @@ from jose import JWTError, ExpiredSignatureError
 
 from api import schemas
 from api.core import security
+from api.core.cache import token_cache, user_cache
 from api.core.exceptions import CredentialsException
-from api.crud.user import UserCrud
-from api.dependencies.db import get_db
+from api.crud.user import AsyncUserCrud
+from api.dependencies.db import get_async_db
 
 
 def get_token(request: Request):
@@ -19,20 +20,34 @@ def get_token(request: Request):
     return header_param
 
 
-def get_current_user(token: str = Depends(get_token), db: Session = Depends(get_db)):
-    """Decode the provided jwt and extract the user using the [sub] field."""
+async def get_current_user(
+    token: str = Depends(get_token), db: AsyncSession = Depends(get_async_db)
+):
+    """Decode the provided jwt and extract the user using the [sub] field.
+
+    Decoded tokens and users are cached, so the hot path needs no query.
+    """
     if not token:
         return None
     try:
-        payload = security.decode_token(token)
-        email = payload.sub
+        email = token_cache.get(token)
         if email is None:
-            # Something wrong with the token
-            raise CredentialsException
-        # Get user from database
-        user = UserCrud.get_user_by_email(db, email)
+            payload = security.decode_token(token)
+            email = payload.sub
+            if email is None:
+                # Something wrong with the token
+                raise CredentialsException
+            email = email.lower()
+            token_cache.set(token, email)
+
+        user = user_cache.get(email)
         if user is None:
-            raise CredentialsException
+            # Get user from database
+            db_user = await AsyncUserCrud.get_user_by_email(db, email)
+            if db_user is None:
+                raise CredentialsException
+            user = schemas.User.from_orm(db_user)
+            user_cache.set(email, user)
         return user
     except (JWTError, ExpiredSignatureError):
         # Something wrong with the token
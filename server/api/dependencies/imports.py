@@ -0,0 +1,56 @@
+from fastapi import HTTPException, status
+
+from api.core.constants import IMPORT_KEEP_FIRST, IMPORT_KEEP_LAST
+
+
+def get_import_options(
+    email_index: int,
+    first_name_index: int = None,
+    last_name_index: int = None,
+    force: bool = False,
+    has_headers: bool = False,
+    duplicates: str = None,
+) -> dict:
+    """Validate the query parameters describing how to import a CSV file into
+    the options of its import job."""
+    # Holds the different indexes. Will be used to find duplicates.
+    indexes = {"email": email_index}
+
+    # Only add indexes if they are not the default.
+    if first_name_index != None:
+        indexes["first_name"] = first_name_index
+    if last_name_index != None:
+        indexes["last_name"] = last_name_index
+
+    # The set of indexes should be the same as the list of indexes. If they are
+    # not the same, that indicates we have duplicates.
+    if len(indexes) != len(set(indexes)):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Indexes cannot be the same",
+        )
+
+    # Check if any of the indexes are less than zero.
+    if any(idx < 0 for idx in indexes.values()):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Indexes cannot be below 0",
+        )
+
+    # Rows repeating an email of the file keep either the first or the last one.
+    # Forced imports overwrite existing prospects row after row, so the last row
+    # of an email won before duplicates were collapsed; they keep it by default.
+    if duplicates is None:
+        duplicates = IMPORT_KEEP_LAST if force else IMPORT_KEEP_FIRST
+    if duplicates not in (IMPORT_KEEP_FIRST, IMPORT_KEEP_LAST):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Duplicates must be first or last",
+        )
+
+    return {
+        "indexes": indexes,
+        "has_headers": has_headers,
+        "force": force,
+        "duplicates": duplicates,
+    }
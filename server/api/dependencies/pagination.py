@@ -0,0 +1,17 @@
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+from api.core.pagination import decode_cursor
+
+
+def get_cursor_id(cursor: Optional[str] = None) -> Optional[int]:
+    """Decode the optional [cursor] query parameter into the id to page after."""
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Invalid cursor"
+        )
@@ -0,0 +1,14 @@
+from fastapi import HTTPException, status
+
+from api.core.constants import MIN_SEARCH_LENGTH
+
+
+def get_search_query(query: str) -> str:
+    """Validate the [query] parameter of a search. Trigram indexes cannot serve
+    queries shorter than a trigram, which would scan all of the user's rows."""
+    if len(query.strip()) < MIN_SEARCH_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"Search queries must be at least {MIN_SEARCH_LENGTH} characters",
+        )
+    return query
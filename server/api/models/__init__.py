@@ -3,3 +3,5 @@ from .prospects import Prospect
 from .campaigns import Campaign
 from .campaign_prospects import CampaignProspect
 from .file import File
+from .import_job import ImportJob
+from .upload import Upload
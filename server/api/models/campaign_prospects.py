@@ -1,6 +1,6 @@
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.functions import func
-from sqlalchemy.sql.schema import Column, ForeignKey
+from sqlalchemy.sql.schema import Column, ForeignKey, UniqueConstraint
 from sqlalchemy.sql.sqltypes import BigInteger, DateTime, Integer
 
 from api.database import Base
@@ -10,10 +10,20 @@ class CampaignProspect(Base):
     """Links Prospects to Campaigns"""
 
     __tablename__ = "campaigns_prospects"
+    __table_args__ = (
+        # A prospect is in a campaign at most once. Also the target of the
+        # ON CONFLICT clause used when adding prospects in bulk.
+        UniqueConstraint(
+            "campaign_id",
+            "prospect_id",
+            name="uq_campaigns_prospects_campaign_id_prospect_id",
+        ),
+    )
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
     campaign_id = Column(BigInteger, ForeignKey("campaigns.id"))
-    prospect_id = Column(BigInteger, ForeignKey("prospects.id"))
+    # Indexed so that deleting prospects does not scan the links for each of them.
+    prospect_id = Column(BigInteger, ForeignKey("prospects.id"), index=True)
 
     prospect = relationship("Prospect", foreign_keys=[prospect_id])
     campaign = relationship("Campaign", foreign_keys=[campaign_id])
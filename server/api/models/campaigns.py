@@ -1,6 +1,6 @@
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.functions import func
-from sqlalchemy.sql.schema import Column, ForeignKey
+from sqlalchemy.sql.schema import Column, ForeignKey, Index
 from sqlalchemy.sql.sqltypes import BigInteger, DateTime, Integer, String
 
 from api.database import Base
@@ -10,10 +10,25 @@ class Campaign(Base):
     """Campaigns Table"""
 
     __tablename__ = "campaigns"
-
-    id = Column(BigInteger, primary_key=True, autoincrement=True, unique=True)
-    name = Column(String, primary_key=True)
-    user_id = Column(BigInteger, ForeignKey("users.id"), primary_key=True)
+    __table_args__ = (
+        # Keyset pagination of a user's campaigns.
+        Index("ix_campaigns_user_id_id", "user_id", "id"),
+        # Substring search on campaign names, ranked by trigram distance.
+        Index(
+            "ix_campaigns_user_id_name_trgm_gist",
+            "user_id",
+            "name",
+            postgresql_using="gist",
+            postgresql_ops={"name": "gist_trgm_ops"},
+        ),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    name = Column(String, nullable=False)
+    user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
+
+    # Kept in step by add_prospects_to_campaign, so listings need no join.
+    prospects_count = Column(BigInteger, nullable=False, default=0, server_default="0")
 
     user = relationship("User", back_populates="campaigns", foreign_keys=[user_id])
 
@@ -2,7 +2,7 @@ from http import server
 from time import timezone
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.functions import func
-from sqlalchemy.sql.schema import Column, ForeignKey
+from sqlalchemy.sql.schema import Column, ForeignKey, Index
 from sqlalchemy.sql.sqltypes import BigInteger, Boolean, DateTime, Integer, String
 
 from api.database import Base
@@ -12,13 +12,24 @@ class File(Base):
     """Files table"""
 
     __tablename__ = "files"
+    __table_args__ = (
+        # Finding earlier uploads of the same content.
+        Index("ix_files_user_id_content_hash", "user_id", "content_hash"),
+    )
 
-    id = Column(BigInteger, primary_key=True, autoincrement=True, unique=True)
-    user_id = Column(BigInteger, ForeignKey("users.id"), primary_key=True)
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
     filename = Column(String, index=True, nullable=False)
     file_size = Column(BigInteger, nullable=False)
     total_rows = Column(Integer, nullable=False)
     done_rows = Column(Integer, default=0)
+    inserted_rows = Column(Integer, default=0)
+    updated_rows = Column(Integer, default=0)
+    skipped_rows = Column(Integer, default=0)
+    invalid_rows = Column(Integer, default=0)
+    duplicate_rows = Column(Integer, default=0)
+    # SHA-256 of the uploaded bytes.
+    content_hash = Column(String, nullable=True)
 
     user = relationship("User", back_populates="files", foreign_keys=[user_id])
     prospects = relationship("Prospect", back_populates="file")
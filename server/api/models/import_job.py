@@ -0,0 +1,33 @@
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql.functions import func
+from sqlalchemy.sql.schema import Column, ForeignKey
+from sqlalchemy.sql.sqltypes import BigInteger, DateTime, Integer, String
+
+from api.core.constants import IMPORT_JOB_QUEUED
+from api.database import Base
+
+
+class ImportJob(Base):
+    """Import jobs queued by the API and claimed by worker processes"""
+
+    __tablename__ = "import_jobs"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
+    file_id = Column(BigInteger, ForeignKey("files.id"), index=True, nullable=False)
+    path = Column(String, nullable=False)
+    options = Column(JSONB, nullable=False)
+    status = Column(String, index=True, nullable=False, default=IMPORT_JOB_QUEUED)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+
+    user = relationship("User", foreign_keys=[user_id])
+    file = relationship("File", foreign_keys=[file_id])
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+
+    def __repr__(self):
+        return f"{self.id} | {self.status}"
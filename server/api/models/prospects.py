@@ -1,6 +1,6 @@
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.functions import func
-from sqlalchemy.sql.schema import Column, ForeignKey
+from sqlalchemy.sql.schema import Column, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.sql.sqltypes import BigInteger, DateTime, String
 
 from api.database import Base
@@ -10,12 +10,31 @@ class Prospect(Base):
     """Prospects Table"""
 
     __tablename__ = "prospects"
-
-    id = Column(BigInteger, primary_key=True, autoincrement=True, unique=True)
-    email = Column(String, primary_key=True, nullable=False)
+    __table_args__ = (
+        # Target of the ON CONFLICT clause used by bulk CSV imports.
+        UniqueConstraint("user_id", "email", name="uq_prospects_user_id_email"),
+        # Keyset pagination of a user's prospects.
+        Index("ix_prospects_user_id_id", "user_id", "id"),
+        # Selecting the prospects of an import.
+        Index("ix_prospects_user_id_file_id", "user_id", "file_id"),
+        # Substring search on emails and names, ranked by trigram distance.
+        *(
+            Index(
+                f"ix_prospects_user_id_{column}_trgm_gist",
+                "user_id",
+                column,
+                postgresql_using="gist",
+                postgresql_ops={column: "gist_trgm_ops"},
+            )
+            for column in ("email", "first_name", "last_name")
+        ),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    email = Column(String, nullable=False)
     first_name = Column(String, index=True, nullable=False)
     last_name = Column(String, index=True, nullable=False)
-    user_id = Column(BigInteger, ForeignKey("users.id"), primary_key=True)
+    user_id = Column(BigInteger, ForeignKey("users.id"), nullable=False)
     file_id = Column(BigInteger, ForeignKey("files.id"))
 
     user = relationship("User", back_populates="prospects", foreign_keys=[user_id])
@@ -0,0 +1,33 @@
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql.functions import func
+from sqlalchemy.sql.schema import Column, ForeignKey
+from sqlalchemy.sql.sqltypes import BigInteger, DateTime, String
+
+from api.database import Base
+
+
+class Upload(Base):
+    """Files being uploaded in chunks, before they are imported"""
+
+    __tablename__ = "uploads"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    user_id = Column(BigInteger, ForeignKey("users.id"), index=True, nullable=False)
+    filename = Column(String, nullable=False)
+    # Announced size of the file, and how many bytes from its start were written.
+    size = Column(BigInteger, nullable=False)
+    received = Column(BigInteger, nullable=False, default=0)
+    # SHA-256 the client announced, checked once the file is complete.
+    checksum = Column(String, nullable=True)
+    path = Column(String, nullable=False)
+    # Import started from the upload once it was finalized.
+    file_id = Column(BigInteger, ForeignKey("files.id"), nullable=True)
+
+    user = relationship("User", foreign_keys=[user_id])
+    file = relationship("File", foreign_keys=[file_id])
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"{self.id} | {self.filename}"
@@ -15,6 +15,11 @@ class User(Base):
     email = Column(String, unique=True, index=True, nullable=False)
     password_digest = Column(String, unique=True, index=True, nullable=False)
 
+    # Kept in step by every path that creates prospects or campaigns, so page
+    # requests do not have to count the user's rows.
+    prospects_count = Column(BigInteger, nullable=False, default=0, server_default="0")
+    campaigns_count = Column(BigInteger, nullable=False, default=0, server_default="0")
+
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now())
 
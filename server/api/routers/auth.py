@@ -1,16 +1,16 @@
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi import status
-from sqlalchemy.orm.session import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.core import security
 from api.schemas.auth import LoginRequestBody, LoginResponse
-from api.dependencies.db import get_db
+from api.dependencies.db import get_async_db
 
 router = APIRouter(prefix="/api", tags=["auth"])
 
 
 @router.post("/login", response_model=LoginResponse)
-async def login(form_data: LoginRequestBody, db: Session = Depends(get_db)):
+async def login(form_data: LoginRequestBody, db: AsyncSession = Depends(get_async_db)):
     """User will attempt to authenticate with a email/password flow"""
 
     user = await security.authenticate_user(db, form_data.email, form_data.password)
@@ -1,64 +1,78 @@
+from typing import Optional
 from fastapi import APIRouter, HTTPException, status, Depends
-from sqlalchemy.orm.session import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.responses import ORJSONResponse
 from starlette.responses import JSONResponse
 
 from api import schemas
 from api.dependencies.auth import get_current_user
+from api.core.pagination import next_cursor
+from api.core.serialization import rows_as_dicts
 from api.core.constants import DEFAULT_PAGE, DEFAULT_PAGE_SIZE
-from api.crud import CampaignCrud, ProspectCrud
-from api.dependencies.db import get_db
+from api.crud import AsyncCampaignCrud
+from api.models import Campaign
+from api.dependencies.db import get_async_db
+from api.dependencies.pagination import get_cursor_id
+from api.dependencies.search import get_search_query
 
 router = APIRouter(prefix="/api", tags=["campaigns"])
 
 
 @router.get("/campaigns", response_model=schemas.CampaignResponse)
-def get_campaign_page(
+async def get_campaign_page(
     current_user: schemas.User = Depends(get_current_user),
     page: int = DEFAULT_PAGE,
     page_size: int = DEFAULT_PAGE_SIZE,
-    db: Session = Depends(get_db),
+    after_id: Optional[int] = Depends(get_cursor_id),
+    exact: bool = False,
+    db: AsyncSession = Depends(get_async_db),
 ):
-    """Get a single page of campaigns"""
+    """Get a single page of campaigns, by cursor or by page number.
+
+    The total comes from a maintained counter; pass exact=true to count the rows.
+    """
     if not current_user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Please log in"
         )
-    campaigns = CampaignCrud.get_users_campaign(db, current_user.id, page, page_size)
-    total = CampaignCrud.get_user_campaign_total(db, current_user.id)
-    return {"campaigns": campaigns, "size": len(campaigns), "total": total}
+    campaigns = await AsyncCampaignCrud.get_users_campaign(
+        db, current_user.id, page, page_size, after_id
+    )
+    total = await AsyncCampaignCrud.get_user_campaign_total(db, current_user.id, exact)
+    # The rows already have the shape of the response model, so skip validating
+    # them again and encode them directly.
+    return ORJSONResponse(
+        {
+            "campaigns": rows_as_dicts(campaigns),
+            "size": len(campaigns),
+            "total": total,
+            "next_cursor": next_cursor(campaigns, page_size),
+        }
+    )
 
 
 @router.get("/campaigns/search", response_model=schemas.CampaignSearchResponse)
-def search_campaigns(
-    query: str,
+async def search_campaigns(
+    query: str = Depends(get_search_query),
     current_user: schemas.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """Search campaigns by name"""
     if not current_user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Please log in"
         )
-    campaigns = CampaignCrud.get_user_campaign_from_name_fragment(
+    campaigns = await AsyncCampaignCrud.get_user_campaign_from_name_fragment(
         db, current_user.id, query
     )
-    return {"campaigns": campaigns}
+    return ORJSONResponse({"campaigns": rows_as_dicts(campaigns)})
 
 
-@router.post(
-    "/campaigns/{campaign_id}/prospects", response_model=schemas.AddToCampaignsResponse
-)
-def add_prospects_to_campaign(
-    data: schemas.AddToCampaigns,
-    campaign_id: str,
-    current_user: schemas.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-):
-    """Validate and add prospects to a campaign"""
-    if not current_user:
-        raise HTTPException(status.HTTP_401_UNAUTHORIZED, detail="Please log in")
-
-    campaign = CampaignCrud.get_by_id(db, campaign_id)
+async def get_user_campaign(
+    db: AsyncSession, campaign_id: int, current_user: schemas.User
+) -> Campaign:
+    """Get a campaign, making sure it belongs to the current user"""
+    campaign = await AsyncCampaignCrud.get_by_id(db, campaign_id)
     if not campaign:
         raise HTTPException(
             status.HTTP_404_NOT_FOUND,
@@ -70,18 +84,82 @@ def add_prospects_to_campaign(
             status.HTTP_403_FORBIDDEN,
             detail=f"You do not have access to that campaign",
         )
+    return campaign
+
 
-    # Get existing prospects for this campaign
-    existing_prospect_ids = CampaignCrud.get_existing_campaign_prospects(
-        db, campaign_id
+@router.post(
+    "/campaigns/{campaign_id}/prospects", response_model=schemas.AddToCampaignsResponse
+)
+async def add_prospects_to_campaign(
+    data: schemas.AddToCampaigns,
+    campaign_id: int,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Add prospects to a campaign.
+
+    Ids of prospects that do not exist, belong to another user or are already in
+    the campaign are ignored; the response lists the prospects actually added.
+    """
+    if not current_user:
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, detail="Please log in")
+
+    campaign = await get_user_campaign(db, campaign_id, current_user)
+    new_prospect_ids = await AsyncCampaignCrud.add_prospects_to_campaign(
+        db, current_user.id, campaign.id, data.prospect_ids
     )
 
-    data.prospect_ids = ProspectCrud.validate_prospect_ids(
-        db, current_user.id, data.prospect_ids
+    return JSONResponse({"prospect_ids": new_prospect_ids}, 200)
+
+
+@router.post(
+    "/campaigns/{campaign_id}/prospects/bulk_add",
+    response_model=schemas.BulkCampaignProspectsResponse,
+)
+async def bulk_add_prospects_to_campaign(
+    selector: schemas.ProspectSelector,
+    campaign_id: int,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Add every prospect matched by the selector to a campaign, in one statement.
+
+    Prospects can be selected by import file, by campaign and by search query;
+    combined criteria must all match.
+    """
+    if not current_user:
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, detail="Please log in")
+
+    campaign = await get_user_campaign(db, campaign_id, current_user)
+    if selector.campaign_id is not None:
+        await get_user_campaign(db, selector.campaign_id, current_user)
+
+    count = await AsyncCampaignCrud.add_selected_to_campaign(
+        db, current_user.id, campaign.id, selector
     )
+    return {"count": count}
+
+
+@router.post(
+    "/campaigns/{campaign_id}/prospects/bulk_remove",
+    response_model=schemas.BulkCampaignProspectsResponse,
+)
+async def bulk_remove_prospects_from_campaign(
+    selector: schemas.ProspectSelector,
+    campaign_id: int,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Remove every prospect matched by the selector from a campaign, in one
+    statement"""
+    if not current_user:
+        raise HTTPException(status.HTTP_401_UNAUTHORIZED, detail="Please log in")
 
-    # Add only valid/non-duplicate prospects
-    new_prospect_ids = data.prospect_ids - existing_prospect_ids
-    CampaignCrud.add_prospects_to_campaign(db, campaign_id, new_prospect_ids)
+    campaign = await get_user_campaign(db, campaign_id, current_user)
+    if selector.campaign_id is not None:
+        await get_user_campaign(db, selector.campaign_id, current_user)
 
-    return JSONResponse({"prospect_ids": list(new_prospect_ids)}, 200)
+    count = await AsyncCampaignCrud.remove_selected_from_campaign(
+        db, current_user.id, campaign.id, selector
+    )
+    return {"count": count}
@@ -0,0 +1,11 @@
+from fastapi import APIRouter, Response
+
+from api.core import metrics
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus metrics of every worker process"""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
@@ -1,35 +1,144 @@
-from fastapi import APIRouter, HTTPException, status, Depends, UploadFile
-from sqlalchemy.orm.session import Session
+import csv
+import os
+from typing import Optional
+from fastapi import (
+    APIRouter,
+    HTTPException,
+    status,
+    Depends,
+    Header,
+    Request,
+    UploadFile,
+)
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from api import schemas
 from api.dependencies.auth import get_current_user
-from api.core.constants import DEFAULT_PAGE, DEFAULT_PAGE_SIZE, MAX_IMPORT_FILE_SIZE
-from api.crud import ProspectCrud, FileCrud
-from api.dependencies.db import get_db
+from api.core import importer
+from api.core.config import settings
+from api.core.pagination import next_cursor
+from api.core.serialization import rows_as_csv, rows_as_dicts, rows_as_ndjson
+from api.core.constants import (
+    DEFAULT_PAGE,
+    DEFAULT_PAGE_SIZE,
+    PROGRESS_KEEPALIVE_SECONDS,
+)
+from api.core.progress import ProgressRate, broadcaster
+from api.crud import (
+    AsyncFileCrud,
+    AsyncImportJobCrud,
+    AsyncProspectCrud,
+    AsyncUploadCrud,
+)
+from api.database import AsyncSessionLocal
+from api.models import Upload
+from api.dependencies.db import get_async_db
+from api.dependencies.imports import get_import_options
+from api.dependencies.pagination import get_cursor_id
+from api.dependencies.search import get_search_query
 import asyncio
-import csv
-import codecs
-import os
 import re
 
 router = APIRouter(prefix="/api", tags=["prospects", "prospects_files"])
-email_pattern = re.compile(r"(^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$)")
+
+CONTENT_RANGE_PATTERN = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+SHA256_PATTERN = re.compile(r"^[0-9a-fA-F]{64}$")
 
 
 @router.get("/prospects", response_model=schemas.ProspectResponse)
-def get_prospects_page(
+async def get_prospects_page(
     current_user: schemas.User = Depends(get_current_user),
     page: int = DEFAULT_PAGE,
     page_size: int = DEFAULT_PAGE_SIZE,
-    db: Session = Depends(get_db),
+    after_id: Optional[int] = Depends(get_cursor_id),
+    exact: bool = False,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Get a single page of prospects, by cursor or by page number.
+
+    The total comes from a maintained counter; pass exact=true to count the rows.
+    """
+    if not current_user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Please log in"
+        )
+    prospects = await AsyncProspectCrud.get_users_prospects(
+        db, current_user.id, page, page_size, after_id
+    )
+    total = await AsyncProspectCrud.get_user_prospects_total(db, current_user.id, exact)
+    # The rows already have the shape of the response model, so skip validating
+    # them again and encode them directly.
+    return ORJSONResponse(
+        {
+            "prospects": rows_as_dicts(prospects),
+            "size": len(prospects),
+            "total": total,
+            "next_cursor": next_cursor(prospects, page_size),
+        }
+    )
+
+
+@router.get("/prospects/search", response_model=schemas.ProspectSearchResponse)
+async def search_prospects(
+    query: str = Depends(get_search_query),
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Search prospects by email, first name and last name"""
+    if not current_user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Please log in"
+        )
+    prospects = await AsyncProspectCrud.search_user_prospects(
+        db, current_user.id, query
+    )
+    return ORJSONResponse({"prospects": rows_as_dicts(prospects)})
+
+
+@router.get("/prospects/export")
+async def export_prospects(
+    format: str = "csv",
+    file_id: Optional[int] = None,
+    campaign_id: Optional[int] = None,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    """Get a single page of prospects"""
+    """Download all the prospects, or those of an import file or a campaign, as
+    CSV or newline-delimited JSON (format=ndjson).
+
+    Rows are read from a server-side cursor and sent as they are read, so
+    exports of any size use constant memory.
+    """
     if not current_user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Please log in"
         )
-    prospects = ProspectCrud.get_users_prospects(db, current_user.id, page, page_size)
-    total = ProspectCrud.get_user_prospects_total(db, current_user.id)
-    return {"prospects": prospects, "size": len(prospects), "total": total}
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Format must be csv or ndjson",
+        )
+    # The session get_current_user may have read from is only released once the
+    # export ends, so give its connection back to the pool now.
+    await db.close()
+
+    async def lines():
+        # The export outlives the request's session, so it reads from its own.
+        async with AsyncSessionLocal() as db:
+            if format == "csv":
+                yield rows_as_csv([list(schemas.Prospect.__fields__)])
+            async for rows in AsyncProspectCrud.stream_user_prospects(
+                db, current_user.id, file_id, campaign_id
+            ):
+                yield rows_as_csv(rows) if format == "csv" else rows_as_ndjson(rows)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        lines(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="prospects.{format}"'},
+    )
 
 
 @router.get(
@@ -38,13 +147,13 @@ def get_prospects_page(
 async def get_prospects_file_progress(
     file_id: int,
     current_user: schemas.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     if not current_user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Please log in"
         )
-    progress = FileCrud.get_file_progress(db, current_user.id, file_id)
+    progress = await AsyncFileCrud.get_file_progress(db, current_user.id, file_id)
     if not progress:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
@@ -53,149 +162,351 @@ async def get_prospects_file_progress(
     return progress
 
 
-async def parse_prospects_csv_rows(
-    db: Session,
-    current_user: schemas.User,
-    current_file: schemas.File,
-    indexes: dict,
-    has_headers: bool,
-    force: bool,
-    csv_rows: list,
+@router.get("/prospects_files/{file_id}/progress/stream")
+async def stream_prospects_file_progress(
+    file_id: int,
+    request: Request,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    # Time to rock and roll... parse the CSV.
-    for i, row in enumerate(csv_rows):
-        # Skip header row.
-        if not i and has_headers:
-            continue
-
-        # Skip any rows if the indexes are out of range.
-        num_col = len(row)
-        if any(idx >= num_col for idx in indexes.values()):
-            continue
-
-        email = row[indexes["email"]]
-        first_name = ""
-        last_name = ""
-
-        # Attempt to validate the email. Skip if invalid.
-        if not email_pattern.match(email):
-            continue
-
-        # Grab first and last name if we were given indexes.
-        if "first_name" in indexes:
-            first_name = row[indexes["first_name"]]
-        if "last_name" in indexes:
-            last_name = row[indexes["last_name"]]
-
-        # Holds new data for creating or updating a prospect.
-        prospect_data = {
-            "email": email,
-            "first_name": first_name,
-            "last_name": last_name,
-        }
+    """Push the progress of an import as Server-Sent Events until it is done"""
+    if not current_user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Please log in"
+        )
+    progress = await AsyncFileCrud.get_file_progress(db, current_user.id, file_id)
+    if not progress:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
+        )
+    # The request's session is only released once the stream ends, so give its
+    # connection back to the pool now; the stream reads from its own sessions.
+    await db.close()
 
-        prospect_found = ProspectCrud.get_user_prospect_email(
-            db, current_user.id, email
+    async def read_progress() -> Optional[schemas.FileProgressEvent]:
+        """Progress of the file, or None once it has been deleted"""
+        async with AsyncSessionLocal() as fresh_db:
+            progress = await AsyncFileCrud.get_file_progress(
+                fresh_db, current_user.id, file_id
+            )
+        if not progress:
+            return None
+        return schemas.FileProgressEvent(file_id=file_id, **progress.dict())
+
+    async def events():
+        rate = ProgressRate()
+        event = rate.update(
+            schemas.FileProgressEvent(file_id=file_id, **progress.dict())
         )
+        yield f"data: {event.json()}\n\n"
+        if event.done_at:
+            return
+
+        queue = broadcaster.subscribe(file_id)
+        try:
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), PROGRESS_KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    # Nothing pushed for a while: re-read the file in case a
+                    # notification was missed, which also keeps the stream alive.
+                    event = await read_progress()
+                    if event is None:
+                        # Ends the stream, as there is no progress left to push.
+                        yield 'event: error\ndata: {"error": "File not found"}\n\n'
+                        return
+
+                event = rate.update(event)
+                yield f"data: {event.json()}\n\n"
+                if event.done_at:
+                    return
+        finally:
+            broadcaster.unsubscribe(file_id, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
 
-        # Only update if forcing and entry exists.
-        # Only create prospects if we don't have an existing prospect.
-        # Skip if there is already an existing project and not forcing.
-        if force and prospect_found:
-            ProspectCrud.update_prospect(db, current_user.id, prospect_data)
-        elif not prospect_found:
-            prospect_found = ProspectCrud.create_prospect(
-                db, current_user.id, prospect_data
+
+async def queue_import(
+    db: AsyncSession,
+    user_id: int,
+    path: str,
+    filename: str,
+    file_size: int,
+    content_hash: str,
+    options: dict,
+    reimport: bool,
+) -> schemas.ProspectImportResponse:
+    """Create the file of a spooled CSV and queue its import for a worker.
+
+    Nothing is committed, so that callers commit the file and its job together
+    with their own changes.
+    """
+    # The same content imported the same way would not change anything, so
+    # point to the earlier import instead, unless asked to import it again.
+    if not reimport:
+        imported_file = await AsyncFileCrud.get_imported_file(
+            db, user_id, content_hash, options, settings.IMPORT_JOB_STALE_SECONDS
+        )
+        if imported_file:
+            os.remove(path)
+            return schemas.ProspectImportResponse(
+                file_id=imported_file.id,
+                filename=imported_file.filename,
+                file_size=imported_file.file_size,
+                total=imported_file.total_rows,
+                already_imported=True,
             )
-        else:
-            continue
 
-        ProspectCrud.update_prospect_file(
-            db, current_user.id, prospect_found.id, current_file.id
+    # Count the rows by streaming over the spooled copy, which also checks that
+    # the workers will be able to read it.
+    try:
+        num_rows = await run_in_threadpool(importer.count_csv_rows, path)
+    except (UnicodeDecodeError, csv.Error) as e:
+        os.remove(path)
+        detail = (
+            "File must be encoded in UTF-8"
+            if isinstance(e, UnicodeDecodeError)
+            else f"File is not a valid CSV file: {e}"
+        )
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=detail
         )
+    num_rows -= int(options["has_headers"])
+
+    # Create file entry in database.
+    current_file = await AsyncFileCrud.create_file(
+        db,
+        user_id,
+        {
+            "filename": filename,
+            "file_size": file_size,
+            "total_rows": num_rows,
+            "content_hash": content_hash,
+        },
+    )
 
-    # Update the finished date time of file.
-    FileCrud.update_file_done_at(db, current_user.id, current_file.id)
+    # Queue the import for a worker process (see worker.py).
+    await AsyncImportJobCrud.enqueue(db, user_id, current_file.id, path, options)
+
+    # Response payload describing summary of the import.
+    return schemas.ProspectImportResponse(
+        file_id=current_file.id,
+        filename=current_file.filename,
+        file_size=current_file.file_size,
+        total=num_rows,
+    )
 
 
 @router.post("/prospect_files/import", response_model=schemas.ProspectImportResponse)
 async def import_prospects_file(
-    email_index: int,
     file: UploadFile,
-    first_name_index: int = None,
-    last_name_index: int = None,
-    force: bool = False,
-    has_headers: bool = False,
+    options: dict = Depends(get_import_options),
+    reimport: bool = False,
     current_user: schemas.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     if not current_user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Please log in"
         )
 
-    # Holds the different indexes. Will be used to find duplicates.
-    indexes = {"email": email_index}
+    # Copy the upload to disk in chunks, checking the size limit as we go.
+    try:
+        path, file_size_bytes, content_hash = await importer.spool_upload(
+            file, settings.MAX_IMPORT_FILE_SIZE
+        )
+    except importer.FileTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)
+        )
+
+    response = await queue_import(
+        db,
+        current_user.id,
+        path,
+        file.filename,
+        file_size_bytes,
+        content_hash,
+        options,
+        reimport,
+    )
+    await db.commit()
+    return response
 
-    # Only add indexes if they are not the default.
-    if first_name_index != None:
-        indexes["first_name"] = first_name_index
-    if last_name_index != None:
-        indexes["last_name"] = last_name_index
 
-    # The set of indexes should be the same as the list of indexes. If they are
-    # not the same, that indicates we have duplicates.
-    if len(indexes) != len(set(indexes)):
+async def get_user_upload(
+    db: AsyncSession,
+    upload_id: int,
+    current_user: schemas.User,
+    for_update: bool = False,
+) -> Upload:
+    if not current_user:
         raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail="Indexes cannot be the same",
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Please log in"
         )
+    upload = await AsyncUploadCrud.get_upload(
+        db, current_user.id, upload_id, for_update
+    )
+    if not upload:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found"
+        )
+    return upload
+
+
+@router.post(
+    "/prospect_files/uploads",
+    response_model=schemas.Upload,
+    status_code=status.HTTP_201_CREATED,
+)
+async def create_upload(
+    data: schemas.UploadCreate,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Start a chunked upload of a CSV file of data.size bytes.
 
-    # Check if any of the indexes are less than zero.
-    if any(idx < 0 for idx in indexes.values()):
+    Send its bytes with PUT requests carrying a Content-Range, in order and in
+    chunks of any size, then finalize it to import it. After a disconnect, get
+    the upload to know from which byte to resume.
+    """
+    if not current_user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Please log in"
+        )
+    if not 0 <= data.size <= settings.MAX_IMPORT_FILE_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"File size cannot exceed {settings.MAX_IMPORT_FILE_SIZE} bytes",
+        )
+    if data.sha256 is not None and not SHA256_PATTERN.match(data.sha256):
         raise HTTPException(
             status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail="Indexes cannot be below 0",
+            detail="sha256 must be 64 hexadecimal characters",
         )
+    path = await run_in_threadpool(importer.create_spool_file)
+    return await AsyncUploadCrud.create_upload(db, current_user.id, data, path)
 
-    # Decode file into a CSV reader object.
-    csv_file = csv.reader(codecs.iterdecode(file.file, "utf-8"))
-    csv_rows = list(csv_file)
-    num_rows = len(csv_rows) - int(has_headers)
 
-    # Go to the end of the file and get the file size.
-    file.file.seek(0, os.SEEK_END)
-    file_size_bytes = file.file.tell()
+@router.get("/prospect_files/uploads/{upload_id}", response_model=schemas.Upload)
+async def get_upload(
+    upload_id: int,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await get_user_upload(db, upload_id, current_user)
 
-    # Check file size does not exceed the max file size.
-    if file_size_bytes > MAX_IMPORT_FILE_SIZE:
+
+@router.put("/prospect_files/uploads/{upload_id}", response_model=schemas.Upload)
+async def upload_range(
+    upload_id: int,
+    request: Request,
+    content_range: str = Header(...),
+    x_content_sha256: Optional[str] = Header(None),
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Write the bytes of the Content-Range (bytes start-end/size) of the upload.
+
+    A range may start anywhere up to the bytes already received, so a chunk
+    interrupted by a disconnect can be sent again. With X-Content-SHA256, the
+    range only counts as received if its SHA-256 matches.
+    """
+    upload = await get_user_upload(db, upload_id, current_user)
+    if upload.file_id:
         raise HTTPException(
-            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
-            detail=f"File size cannot exceed {MAX_IMPORT_FILE_SIZE} bytes",
+            status_code=status.HTTP_409_CONFLICT, detail="Upload already finalized"
         )
 
-    # Create file entry in database.
-    current_file = FileCrud.create_file(
-        db,
-        current_user.id,
-        {
-            "filename": file.filename,
-            "file_size": file_size_bytes,
-            "total_rows": num_rows,
-        },
-    )
+    match = CONTENT_RANGE_PATTERN.match(content_range)
+    if not match:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Content-Range must be bytes start-end/size",
+        )
+    start, end, size = (int(value) for value in match.groups())
+    if size != upload.size or not start <= end < size:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail=f"Range must be within the {upload.size} bytes of the upload",
+        )
+    if start > upload.received:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload received {upload.received} bytes, resume from there",
+        )
 
-    # Create an asynchronous task to do in the background.
-    asyncio.get_event_loop().create_task(
-        parse_prospects_csv_rows(
-            db, current_user, current_file, indexes, has_headers, force, csv_rows
+    try:
+        written, range_hash = await importer.spool_range(
+            request.stream(), upload.path, start, end + 1
         )
-    )
+    except importer.RangeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, detail=str(e)
+        )
+    if x_content_sha256 is not None:
+        if written != end + 1 - start or range_hash != x_content_sha256.lower():
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Range does not match X-Content-SHA256, send it again",
+            )
+    return await AsyncUploadCrud.advance_received(db, upload, start + written)
 
-    # Response payload describing summary of the import.
-    return schemas.ProspectImportResponse(
-        file_id=current_file.id,
-        filename=current_file.filename,
-        file_size=current_file.file_size,
-        total=num_rows,
-    )
+
+@router.post(
+    "/prospect_files/uploads/{upload_id}/finalize",
+    response_model=schemas.ProspectImportResponse,
+)
+async def finalize_upload(
+    upload_id: int,
+    options: dict = Depends(get_import_options),
+    reimport: bool = False,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Check that the upload is complete and matches its checksum, then import
+    it, straight from its spooled file."""
+    # Locked until the import is queued and the upload marked as finalized, all
+    # in one transaction, so a concurrent finalize waits and then returns the
+    # same file instead of queueing the upload twice.
+    upload = await get_user_upload(db, upload_id, current_user, for_update=True)
+    if upload.file_id:
+        file = await AsyncFileCrud.get_file(db, current_user.id, upload.file_id)
+        return schemas.ProspectImportResponse(
+            file_id=file.id,
+            filename=file.filename,
+            file_size=file.file_size,
+            total=file.total_rows,
+        )
+    if upload.received < upload.size:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Upload received {upload.received} of {upload.size} bytes",
+        )
+
+    content_hash = await run_in_threadpool(importer.hash_file, upload.path)
+    if upload.checksum and content_hash != upload.checksum:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Upload does not match its sha256, send it again",
+        )
+
+    try:
+        response = await queue_import(
+            db,
+            current_user.id,
+            upload.path,
+            upload.filename,
+            upload.size,
+            content_hash,
+            options,
+            reimport,
+        )
+    except HTTPException:
+        # Its spooled file was rejected and removed, start over.
+        await AsyncUploadCrud.delete_upload(db, upload)
+        raise
+    await AsyncUploadCrud.set_file(db, upload, response.file_id)
+    return response
@@ -1,12 +1,12 @@
 # FastAPI
 from fastapi import APIRouter, HTTPException, status, Depends
-from sqlalchemy.orm.session import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from api import schemas
 from api.core import security
-from api.crud import UserCrud
+from api.crud import AsyncUserCrud
 from api.dependencies.auth import get_current_user
-from api.dependencies.db import get_db
+from api.dependencies.db import get_async_db
 
 router = APIRouter(prefix="/api", tags=["user"])
 
@@ -24,12 +24,14 @@ def get_authenticated_user(
 
 
 @router.post("/users", response_model=schemas.RegisterResponse)
-def create_user(data: schemas.UserCreate, db: Session = Depends(get_db)):
+async def create_user(
+    data: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)
+):
     """Create a new user record in the database and send a registration confirmation email"""
-    db_user = UserCrud.get_user_by_email(db, data.email)
+    db_user = await AsyncUserCrud.get_user_by_email(db, data.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    new_user = UserCrud.create_user(db, data)
+    new_user = await AsyncUserCrud.create_user(db, data)
 
     token = security.create_access_token(data={"sub": new_user.email})
 
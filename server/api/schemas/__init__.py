@@ -4,3 +4,4 @@ from .token import *
 from .prospects import *
 from .campaigns import *
 from .file import *
+from .upload import *
@@ -33,6 +33,7 @@ class CampaignResponse(BaseModel):
     campaigns: List[Campaign]
     size: int
     total: int
+    next_cursor: Optional[str]
 
 
 class AddToCampaigns(BaseModel):
@@ -41,3 +42,9 @@ class AddToCampaigns(BaseModel):
 
 class AddToCampaignsResponse(BaseModel):
     prospect_ids: List[int]
+
+
+class BulkCampaignProspectsResponse(BaseModel):
+    """Number of prospects added to or removed from a campaign"""
+
+    count: int
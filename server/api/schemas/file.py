@@ -10,6 +10,12 @@ class File(BaseModel):
     file_size_bytes: int
     total_rows: int
     done_rows: int
+    inserted_rows: int
+    updated_rows: int
+    skipped_rows: int
+    invalid_rows: int
+    duplicate_rows: int
+    content_hash: Union[str, None]
     uploaded_at: datetime
     done_at: datetime
 
@@ -21,9 +27,23 @@ class FileCreate(BaseModel):
     filename: str
     file_size_bytes: int
     total_rows: int
+    content_hash: Union[str, None]
 
 
 class FileProgressResponse(BaseModel):
     total: int
     done: int
+    inserted: int
+    updated: int
+    skipped: int
+    invalid: int
+    duplicates: int
     done_at: Union[datetime, None]
+
+
+class FileProgressEvent(FileProgressResponse):
+    """Progress pushed to streaming clients as import batches commit"""
+
+    file_id: int
+    rate: Union[float, None]
+    eta: Union[float, None]
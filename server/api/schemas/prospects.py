@@ -1,9 +1,11 @@
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, root_validator, validator
 from pydantic.networks import EmailStr
 
+from api.core.constants import MIN_SEARCH_LENGTH
+
 
 class Prospect(BaseModel):
     id: int
@@ -29,6 +31,11 @@ class ProspectResponse(BaseModel):
     prospects: List[Prospect]
     size: int
     total: int
+    next_cursor: Optional[str]
+
+
+class ProspectSearchResponse(BaseModel):
+    prospects: List[Prospect]
 
 
 class ProspectImportResponse(BaseModel):
@@ -36,3 +43,33 @@ class ProspectImportResponse(BaseModel):
     filename: str
     file_size: int
     total: int
+    # The same content was already imported with the same options, as file_id.
+    already_imported: bool = False
+
+
+class ProspectSelector(BaseModel):
+    """Selects the user's prospects matching every given criterion"""
+
+    # Prospects last imported from this file.
+    file_id: Optional[int]
+    # Prospects in this campaign.
+    campaign_id: Optional[int]
+    # Prospects whose email or name contains this text, as in the search.
+    query: Optional[str]
+
+    @validator("query")
+    def check_query_length(cls, query):
+        # Shorter queries match almost everything and cannot use the indexes.
+        if query is not None:
+            query = query.strip()
+            if len(query) < MIN_SEARCH_LENGTH:
+                raise ValueError(
+                    f"Search queries must be at least {MIN_SEARCH_LENGTH} characters"
+                )
+        return query
+
+    @root_validator(skip_on_failure=True)
+    def check_any_criterion(cls, values):
+        if all(value is None for value in values.values()):
+            raise ValueError("Select prospects by file_id, campaign_id or query")
+        return values
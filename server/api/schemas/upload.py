@@ -0,0 +1,23 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class UploadCreate(BaseModel):
+    filename: str
+    size: int
+    # Hex SHA-256 of the whole file, checked once it is uploaded.
+    sha256: Optional[str]
+
+
+class Upload(BaseModel):
+    """State of a chunked upload. Resume it by sending the bytes from received."""
+
+    id: int
+    filename: str
+    size: int
+    received: int
+    file_id: Optional[int]
+
+    class Config:
+        orm_mode = True
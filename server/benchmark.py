@@ -0,0 +1,421 @@
+#!/usr/bin/python3
+
+"""Benchmark the API hot paths against the database configured in .env.
+
+Starts the server and an import worker, generates a dedicated benchmark user
+with the requested data volumes (see generate.py), runs every scenario and
+prints latency percentiles, throughput and SQL statements per request. Results
+can be written as JSON with --output and compared with a previous run with
+--compare. The benchmark user and its data are deleted afterwards, so the rest
+of the database is left untouched.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+from sqlalchemy import text
+
+from api.core.constants import MIN_SEARCH_LENGTH
+from api.core.pagination import encode_cursor
+from api.database import SessionLocal
+from generate import FIRST_NAMES, LAST_NAMES, PASSWORD, generate_data
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Measures of a scenario shown by --compare.
+COMPARED_MEASURES = (
+    "throughput",
+    "p50_ms",
+    "p99_ms",
+    "sql_statements",
+    "rows_per_second",
+)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prospects", type=int, default=100000)
+    parser.add_argument("--campaigns", type=int, default=100)
+    parser.add_argument(
+        "--density",
+        type=float,
+        default=0.1,
+        help="share of the prospects already in each campaign",
+    )
+    parser.add_argument("--files", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=500, help="per scenario")
+    parser.add_argument("--login-requests", type=int, default=50)
+    parser.add_argument("--add-requests", type=int, default=20)
+    parser.add_argument("--add-payload", type=int, default=10000, help="ids per add")
+    parser.add_argument("--import-rows", type=int, default=100000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=1, help="server processes")
+    parser.add_argument("--port", type=int, default=3999)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of a previous run")
+    return parser.parse_args()
+
+
+def seed(args: argparse.Namespace) -> Dict:
+    """Generate the benchmark user and its data"""
+    email = f"benchmark-{uuid.uuid4().hex[:8]}@example.com"
+    [user_id] = generate_data(
+        users=1,
+        prospects=args.prospects,
+        campaigns=args.campaigns,
+        density=args.density,
+        files=args.files,
+        seed=args.seed,
+        email_format=email,
+    )
+    db = SessionLocal()
+    try:
+        prospect_ids = db.execute(
+            text("SELECT id FROM prospects WHERE user_id = :user_id ORDER BY id"),
+            {"user_id": user_id},
+        ).scalars()
+        campaign_ids = db.execute(
+            text("SELECT id FROM campaigns WHERE user_id = :user_id ORDER BY id"),
+            {"user_id": user_id},
+        ).scalars()
+        return {
+            "id": user_id,
+            "email": email,
+            "prospect_ids": list(prospect_ids),
+            "campaign_ids": list(campaign_ids),
+        }
+    finally:
+        db.close()
+
+
+def cleanup(user_id: int):
+    """Delete the benchmark user and everything it owns"""
+    print("-- Deleting Benchmark Data --")
+    db = SessionLocal()
+    try:
+        for statement in (
+            "DELETE FROM campaigns_prospects WHERE campaign_id IN"
+            " (SELECT id FROM campaigns WHERE user_id = :user_id)",
+            "DELETE FROM import_jobs WHERE user_id = :user_id",
+            "DELETE FROM campaigns WHERE user_id = :user_id",
+            "DELETE FROM prospects WHERE user_id = :user_id",
+            "DELETE FROM files WHERE user_id = :user_id",
+            "DELETE FROM users WHERE id = :user_id",
+        ):
+            db.execute(text(statement), {"user_id": user_id})
+        db.commit()
+    finally:
+        db.close()
+
+
+def start_processes(args: argparse.Namespace) -> List[subprocess.Popen]:
+    env = dict(os.environ)
+    if args.workers > 1:
+        env["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="benchmark_metrics")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", SERVER_DIR]
+        + ["--port", str(args.port), "--workers", str(args.workers)]
+        + ["--log-level", "warning"],
+        env=env,
+    )
+    worker = subprocess.Popen(
+        [sys.executable, os.path.join(SERVER_DIR, "worker.py")],
+        stdout=subprocess.DEVNULL,
+    )
+    return [server, worker]
+
+
+def wait_for_server(base_url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/metrics").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server did not start within {timeout} seconds")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    index = max(int(round(pct / 100 * len(values))) - 1, 0)
+    return values[index]
+
+
+async def sql_statements(client: httpx.AsyncClient) -> Tuple[float, float]:
+    """SQL statements run by the API so far and the number of requests that ran
+    them, from its http_request_sql_statements histogram"""
+    response = await client.get("/metrics")
+    response.raise_for_status()
+    totals = {"sum": 0.0, "count": 0.0}
+    for family in text_string_to_metric_families(response.text):
+        if family.name != "http_request_sql_statements":
+            continue
+        for sample in family.samples:
+            suffix = sample.name.rsplit("_", 1)[-1]
+            if suffix in totals and sample.labels["route"] != "/metrics":
+                totals[suffix] += sample.value
+    return totals["sum"], totals["count"]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    name: str,
+    count: int,
+    concurrency: int,
+    send: Callable[[int], Awaitable[httpx.Response]],
+) -> Dict:
+    """Send count requests, at most concurrency at a time, and summarize them
+    along with the SQL statements each of them ran on average"""
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await send(i)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    statements_before, requests_before = await sql_statements(client)
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    seconds = time.perf_counter() - start
+    statements, requests = await sql_statements(client)
+    statements -= statements_before
+    requests -= requests_before
+
+    latencies.sort()
+    result = {
+        "requests": count,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "throughput": round(count / seconds, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2),
+        "sql_statements": round(statements / requests, 2) if requests else None,
+    }
+    print(
+        f"...{name}: {result['throughput']} req/s, p50 {result['p50_ms']} ms,"
+        f" p99 {result['p99_ms']} ms, {result['sql_statements']} statements/req,"
+        f" {errors} errors"
+    )
+    return result
+
+
+async def run_import(client: httpx.AsyncClient, rows: int) -> Dict:
+    """Upload a CSV of new prospects and wait for the worker to import it"""
+    csv = "email,first_name,last_name\n" + "".join(
+        f"imported{i}@example.com,First {i},Last {i}\n" for i in range(rows)
+    )
+    start = time.perf_counter()
+    response = await client.post(
+        "/api/prospect_files/import",
+        params={
+            "email_index": 0,
+            "first_name_index": 1,
+            "last_name_index": 2,
+            "has_headers": True,
+        },
+        files={"file": ("benchmark.csv", csv.encode())},
+    )
+    response.raise_for_status()
+    file_id = response.json()["file_id"]
+    while True:
+        progress = (await client.get(f"/api/prospects_files/{file_id}/progress")).json()
+        if progress["done_at"]:
+            break
+        await asyncio.sleep(0.1)
+    seconds = time.perf_counter() - start
+
+    result = {
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds, 2),
+    }
+    print(f"...import: {result['rows_per_second']} rows/s")
+    return result
+
+
+async def run_benchmarks(args: argparse.Namespace, user: Dict) -> Dict:
+    rnd = random.Random(args.seed)
+    base_url = f"http://127.0.0.1:{args.port}"
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        base_url=base_url, limits=limits, timeout=600
+    ) as client:
+        credentials = {"email": user["email"], "password": PASSWORD}
+        response = await client.post("/api/login", json=credentials)
+        response.raise_for_status()
+        client.headers["Authorization"] = f"Bearer {response.json()['token']}"
+
+        prospect_ids = user["prospect_ids"]
+        campaign_ids = user["campaign_ids"]
+        page_size = args.page_size
+        last_page = max(len(prospect_ids) // page_size - 1, 0)
+        # The last page by cursor starts after the row just before it. The first
+        # page, the only one of small volumes, has no cursor.
+        deep_cursor_params = {"page_size": page_size}
+        if last_page > 0:
+            last_id = prospect_ids[last_page * page_size - 1]
+            deep_cursor_params["cursor"] = encode_cursor(last_id)
+        # Small pages, so that there are several to go through. Each page should
+        # run as many statements as the first one, whatever its size.
+        campaigns_page_size = 10
+        campaigns_pages = max(-(-len(campaign_ids) // campaigns_page_size), 1)
+        names = [
+            name for name in FIRST_NAMES + LAST_NAMES if len(name) >= MIN_SEARCH_LENGTH
+        ]
+        payloads = [
+            rnd.sample(prospect_ids, min(args.add_payload, len(prospect_ids)))
+            for _ in range(args.add_requests)
+        ]
+
+        scenarios = [
+            (
+                "login",
+                args.login_requests,
+                lambda i: client.post("/api/login", json=credentials),
+            ),
+            (
+                "prospects_first_page",
+                args.requests,
+                lambda i: client.get("/api/prospects", params={"page_size": page_size}),
+            ),
+            (
+                "prospects_deep_page",
+                args.requests,
+                lambda i: client.get(
+                    "/api/prospects",
+                    params={"page": last_page, "page_size": page_size},
+                ),
+            ),
+            (
+                "prospects_deep_cursor",
+                args.requests,
+                lambda i: client.get("/api/prospects", params=deep_cursor_params),
+            ),
+            (
+                "campaigns_first_page",
+                args.requests,
+                lambda i: client.get("/api/campaigns", params={"page_size": page_size}),
+            ),
+            (
+                "campaigns_pages",
+                args.requests,
+                lambda i: client.get(
+                    "/api/campaigns",
+                    params={
+                        "page": i % campaigns_pages,
+                        "page_size": campaigns_page_size,
+                    },
+                ),
+            ),
+            (
+                "campaigns_search",
+                args.requests,
+                lambda i: client.get(
+                    "/api/campaigns/search",
+                    params={"query": f"Campaign {rnd.randint(1, args.campaigns)}"},
+                ),
+            ),
+            (
+                "prospects_search",
+                args.requests,
+                lambda i: client.get(
+                    "/api/prospects/search",
+                    params={"query": rnd.choice(names)},
+                ),
+            ),
+            (
+                "campaigns_add_prospects",
+                args.add_requests,
+                lambda i: client.post(
+                    f"/api/campaigns/{campaign_ids[i % len(campaign_ids)]}/prospects",
+                    json={"prospect_ids": payloads[i]},
+                ),
+            ),
+        ]
+
+        print("-- Running Benchmarks --")
+        results = {}
+        for name, count, send in scenarios:
+            results[name] = await run_scenario(
+                client, name, count, args.concurrency, send
+            )
+        results["import"] = await run_import(client, args.import_rows)
+        return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=SERVER_DIR,
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous: Dict, current: Dict):
+    """Print how each measure changed since the previous results"""
+    print(f"-- Compared To {previous.get('commit') or 'Previous Run'} --")
+    for name, result in current["results"].items():
+        old = previous["results"].get(name)
+        if not old:
+            continue
+        changes = []
+        for key in COMPARED_MEASURES:
+            if result.get(key) is not None and old.get(key):
+                change = (result[key] - old[key]) / old[key] * 100
+                changes.append(f"{key} {old[key]} -> {result[key]} ({change:+.1f}%)")
+        print(f"...{name}: " + ", ".join(changes))
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    started_at = datetime.now(timezone.utc).isoformat()
+    user = seed(args)
+    processes = start_processes(args)
+    try:
+        wait_for_server(f"http://127.0.0.1:{args.port}")
+        results = asyncio.run(run_benchmarks(args, user))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+        cleanup(user["id"])
+
+    report = {
+        "commit": git_commit(),
+        "started_at": started_at,
+        "parameters": vars(args),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+
+"""Check that the hot queries of the API are served by indexes.
+
+Plans each statement built by api/crud with EXPLAIN against the database in
+.env, sequential scans disabled, and fails if any plan still reads a whole
+table or index: the planner only falls back to one then when no index can
+serve the query. An index only serves a query with a condition on its first
+column. Nothing is executed, so any database can be checked, even an
+empty one; run it after changing a query or a migration.
+"""
+
+import re
+import sys
+from typing import Callable, Dict, List
+
+from sqlalchemy import event, text
+from sqlalchemy.sql import Executable
+
+from api import schemas
+from api.core.constants import IMPORT_KEEP_FIRST
+from api.crud import CampaignCrud, FileCrud, ProspectCrud, UploadCrud, UserCrud
+from api.database import engine
+
+USER_ID = 1
+CAMPAIGN_ID = 1
+FILE_ID = 1
+
+INDEX_SCANS = ("Index Scan", "Index Only Scan", "Bitmap Index Scan")
+
+# Statement builders of the request and import hot paths, by name.
+QUERIES: Dict[str, Callable[[], Executable]] = {
+    "user_by_email": lambda: UserCrud.by_email_query("test@test.com"),
+    "prospects_page": lambda: ProspectCrud.users_prospects_query(USER_ID, page=10),
+    "prospects_cursor": lambda: ProspectCrud.users_prospects_query(
+        USER_ID, after_id=1000
+    ),
+    "prospects_exact_total": lambda: ProspectCrud.total_query(USER_ID, exact=True),
+    "prospects_total": lambda: ProspectCrud.total_query(USER_ID),
+    "prospects_search": lambda: ProspectCrud.search_query(USER_ID, "smith"),
+    "prospects_export": lambda: ProspectCrud.export_query(USER_ID),
+    "prospects_export_file": lambda: ProspectCrud.export_query(
+        USER_ID, file_id=FILE_ID
+    ),
+    "prospects_export_campaign": lambda: ProspectCrud.export_query(
+        USER_ID, campaign_id=CAMPAIGN_ID
+    ),
+    "prospects_existing_emails": lambda: ProspectCrud.existing_emails_query(
+        USER_ID, ["a@example.com", "b@example.com"]
+    ),
+    "campaigns_page": lambda: CampaignCrud.users_campaign_query(USER_ID, page=10),
+    "campaigns_cursor": lambda: CampaignCrud.users_campaign_query(
+        USER_ID, after_id=1000
+    ),
+    "campaigns_exact_total": lambda: CampaignCrud.total_query(USER_ID, exact=True),
+    "campaigns_search": lambda: CampaignCrud.name_fragment_query(USER_ID, "launch"),
+    "campaigns_add_prospects": lambda: CampaignCrud.add_prospects_query(
+        USER_ID, CAMPAIGN_ID, [1, 2, 3]
+    ),
+    "campaigns_add_selected_file": lambda: CampaignCrud.add_selected_query(
+        USER_ID, CAMPAIGN_ID, schemas.ProspectSelector(file_id=FILE_ID)
+    ),
+    "campaigns_add_selected_campaign": lambda: CampaignCrud.add_selected_query(
+        USER_ID, CAMPAIGN_ID, schemas.ProspectSelector(campaign_id=CAMPAIGN_ID + 1)
+    ),
+    "campaigns_remove_selected": lambda: CampaignCrud.remove_selected_query(
+        USER_ID, CAMPAIGN_ID, schemas.ProspectSelector(file_id=FILE_ID)
+    ),
+    "campaigns_count": lambda: CampaignCrud.prospects_count_query(CAMPAIGN_ID, 1),
+    "file": lambda: FileCrud.file_query(USER_ID, FILE_ID),
+    "file_imported": lambda: FileCrud.imported_file_query(
+        USER_ID, "0" * 64, {"duplicates": IMPORT_KEEP_FIRST}, 300
+    ),
+    "upload": lambda: UploadCrud.upload_query(USER_ID, 1),
+}
+
+
+def explain(connection, statement: Executable) -> dict:
+    """Plan of the statement, as EXPLAIN (FORMAT JSON) returns it"""
+    plans = []
+
+    def prefix_explain(conn, cursor, sql, parameters, context, executemany):
+        return "EXPLAIN (FORMAT JSON) " + sql, parameters
+
+    # Read here, since no rows are fetched for an INSERT or DELETE.
+    def fetch_plan(conn, cursor, sql, parameters, context, executemany):
+        [[plan]] = cursor.fetchall()
+        plans.append(plan[0]["Plan"])
+
+    # Server-side cursors (exports) cannot be declared for an EXPLAIN.
+    statement = statement.execution_options(stream_results=False, yield_per=None)
+    event.listen(connection, "before_cursor_execute", prefix_explain, retval=True)
+    event.listen(connection, "after_cursor_execute", fetch_plan)
+    try:
+        connection.execute(statement)
+    finally:
+        event.remove(connection, "before_cursor_execute", prefix_explain)
+        event.remove(connection, "after_cursor_execute", fetch_plan)
+    return plans[0]
+
+
+def leading_column(connection, index: str) -> str:
+    return connection.execute(
+        text(
+            "SELECT attname FROM pg_index JOIN pg_attribute"
+            " ON attrelid = indrelid AND attnum = indkey[0]"
+            " WHERE indexrelid = to_regclass(:index)"
+        ),
+        {"index": index},
+    ).scalar()
+
+
+def full_scans(connection, plan: dict) -> List[str]:
+    """Tables read whole anywhere in the plan: scanned sequentially, or through
+    an index without a condition on its leading column"""
+    scans = []
+    if plan["Node Type"] == "Seq Scan":
+        scans.append(plan["Relation Name"])
+    elif plan["Node Type"] in INDEX_SCANS:
+        column = leading_column(connection, plan["Index Name"])
+        if not re.search(rf"\b{column}\b", plan.get("Index Cond", "")):
+            scans.append(plan["Index Name"])
+    for child in plan.get("Plans", []):
+        scans += full_scans(connection, child)
+    return scans
+
+
+def check_indexes() -> bool:
+    print("-- Checking Query Plans --")
+    ok = True
+    with engine.connect() as connection:
+        connection.exec_driver_sql("SET enable_seqscan = off")
+        for name, build in QUERIES.items():
+            with connection.begin():
+                scans = full_scans(connection, explain(connection, build()))
+            if scans:
+                ok = False
+                print(f"...{name}: FAIL, full scan of {', '.join(scans)}")
+            else:
+                print(f"...{name}: ok")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if check_indexes() else 1)
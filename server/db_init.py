@@ -1,12 +1,24 @@
 #!/usr/bin/python3
 
+import os
 import sys
 from typing import List
-from sqlalchemy import MetaData
-from sqlalchemy.sql.schema import Table
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import MetaData, Table
 
 from api.database import Base, engine
-from api.models import User, Prospect, Campaign, CampaignProspect, File
+from api.models import (
+    User,
+    Prospect,
+    Campaign,
+    CampaignProspect,
+    File,
+    ImportJob,
+    Upload,
+)
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
 
 
 if __name__ == "__main__":
@@ -14,20 +26,20 @@ if __name__ == "__main__":
 
     if len(args) > 1 and args[1] == "drop":
         ordered_drop: List[Table] = [
+            Upload.__table__,
+            ImportJob.__table__,
             CampaignProspect.__table__,
             Campaign.__table__,
             Prospect.__table__,
             User.__table__,
             File.__table__,
+            Table("alembic_version", MetaData()),
         ]
         print("\n-- Dropping All Tables --")
         for t in ordered_drop:
             print(f"...{t.name}")
         Base.metadata.drop_all(bind=engine, tables=ordered_drop)
 
-    print("\n-- Creating Tables --")
-    metadata: MetaData = Base.metadata
-    metadata.create_all(bind=engine)
-    # Note: order of table creation depends on import order in api/models/__init__.py
-    for t in metadata.tables:
-        print(f"...{t}")
+    print("\n-- Migrating Tables --")
+    # Creates the tables, or brings existing ones up to date (see migrations/)
+    command.upgrade(Config(os.path.join(SERVER_DIR, "alembic.ini")), "head")
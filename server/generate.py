@@ -0,0 +1,262 @@
+#!/usr/bin/python3
+
+"""Generate large volumes of data to reproduce scaling issues locally.
+
+Rows are streamed to PostgreSQL with COPY, with their ids reserved up front
+from the tables' sequences, so tens of millions of rows load in minutes. The
+same options and seed always generate the same data.
+"""
+
+import argparse
+import io
+import random
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from passlib.hash import bcrypt
+
+from api.database import engine
+
+# Rows sent per COPY statement, which bounds the memory used.
+COPY_BATCH_ROWS = 100000
+# Generated users all get the same password. Hashing it with few rounds keeps
+# the generation fast; it is rehashed with the configured rounds on login.
+PASSWORD = "sample"
+PASSWORD_ROUNDS = 4
+
+FIRST_NAMES = (
+    "Ada Alan Barbara Carlos Chen Dmitri Elena Fatima Grace Hiro Ines John Kwame"
+    " Leila Linus Margaret Mohamed Nina Olga Pedro Priya Quentin Rosa Sven Tomas"
+    " Uma Victor Wei Yara Zoe"
+).split()
+LAST_NAMES = (
+    "Anderson Brown Cohen Dubois Evans Fischer Garcia Hansen Ito Jensen Kim Lopez"
+    " Martin Nakamura Novak Okafor Petrov Quinn Rossi Silva Smith Tanaka Usman"
+    " Virtanen Wagner Xu Yilmaz Zhang"
+).split()
+
+
+def reserve_ids(cursor, table: str, count: int) -> int:
+    """Take count consecutive ids from the table's sequence and return the first"""
+    if count == 0:
+        return 0
+    cursor.execute(
+        "SELECT setval(pg_get_serial_sequence(%(table)s, 'id'),"
+        " nextval(pg_get_serial_sequence(%(table)s, 'id')) + %(count)s - 1)",
+        {"table": table, "count": count},
+    )
+    return cursor.fetchone()[0] - count + 1
+
+
+def copy_rows(cursor, table: str, columns: str, rows: Iterable[Tuple]) -> int:
+    """Stream rows to the table with COPY, a batch at a time.
+
+    Values are written as is, so they must not contain tabs, newlines or
+    backslashes; None is written as NULL.
+    """
+    statement = f"COPY {table} ({columns}) FROM STDIN"
+    buffer = io.StringIO()
+    count = 0
+    for row in rows:
+        buffer.write("\t".join("\\N" if v is None else str(v) for v in row) + "\n")
+        count += 1
+        if count % COPY_BATCH_ROWS == 0:
+            buffer.seek(0)
+            cursor.copy_expert(statement, buffer)
+            buffer = io.StringIO()
+    buffer.seek(0)
+    cursor.copy_expert(statement, buffer)
+    return count
+
+
+def drop_indexes(cursor, tables: List[str]) -> List[str]:
+    """Drop the foreign keys and the non-unique indexes of the tables, and return
+    the statements creating them again.
+
+    Checking and indexing the rows once they are all loaded is much faster than
+    doing it row by row. Unique indexes are kept, since they enforce the data.
+    """
+    statements = []
+    for table in tables:
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint"
+            " WHERE conrelid = %s::regclass AND contype = 'f'",
+            (table,),
+        )
+        for name, definition in cursor.fetchall():
+            cursor.execute(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"')
+            statements.append(
+                f'ALTER TABLE {table} ADD CONSTRAINT "{name}" {definition}'
+            )
+        cursor.execute(
+            "SELECT indexrelid::regclass::text, pg_get_indexdef(indexrelid)"
+            " FROM pg_index WHERE indrelid = %s::regclass AND NOT indisunique",
+            (table,),
+        )
+        for name, definition in cursor.fetchall():
+            cursor.execute(f"DROP INDEX {name}")
+            statements.insert(0, definition)
+    return statements
+
+
+def generate_data(
+    users: int = 1,
+    prospects: int = 100000,
+    campaigns: int = 100,
+    density: float = 0.1,
+    files: int = 10,
+    seed: int = 0,
+    email_format: str = "user{n}@example.com",
+    keep_indexes: bool = False,
+) -> List[int]:
+    """Generate users with their prospects, campaigns, campaign members and
+    import files, and return the ids of the users.
+
+    Each user gets prospects prospects, spread over files import files, and
+    campaigns campaigns each containing a density share of its prospects. Users
+    log in with email_format, where {n} is the number of the user, and the
+    password "sample".
+
+    Unless keep_indexes is set, the foreign keys and non-unique indexes of the
+    tables are rebuilt after loading, which locks the tables until it is done.
+    """
+    members = min(round(prospects * density), prospects)
+    conn = engine.raw_connection()
+    try:
+        cursor = conn.cursor()
+        first_user = reserve_ids(cursor, "users", users)
+        first_file = reserve_ids(cursor, "files", users * files)
+        first_prospect = reserve_ids(cursor, "prospects", users * prospects)
+        first_campaign = reserve_ids(cursor, "campaigns", users * campaigns)
+        user_ids = list(range(first_user, first_user + users))
+
+        def user_rows() -> Iterator[Tuple]:
+            for n, user_id in enumerate(user_ids, start=1):
+                digest = bcrypt.using(rounds=PASSWORD_ROUNDS).hash(PASSWORD)
+                email = email_format.format(n=n)
+                yield user_id, email, digest, prospects, campaigns
+
+        # Files hold consecutive ranges of their user's prospects: file f holds
+        # the prospects from first_row(f) up to first_row(f + 1).
+        def first_row(f: int) -> int:
+            return -(-f * prospects // files)
+
+        def file_of(u: int, i: int) -> Optional[int]:
+            if not files:
+                return None
+            return first_file + u * files + i * files // prospects
+
+        def file_rows() -> Iterator[Tuple]:
+            for u, user_id in enumerate(user_ids):
+                rnd = random.Random(f"{seed}-files-{u}")
+                for f in range(files):
+                    rows = first_row(f + 1) - first_row(f)
+                    size = rows * rnd.randint(40, 80)
+                    file_id = first_file + u * files + f
+                    filename = f"import{f + 1}.csv"
+                    yield file_id, user_id, filename, size, rows, rows, rows, 0, 0, 0, 0
+
+        def prospect_rows() -> Iterator[Tuple]:
+            for u, user_id in enumerate(user_ids):
+                rnd = random.Random(f"{seed}-prospects-{u}")
+                for i in range(prospects):
+                    first_name = rnd.choice(FIRST_NAMES)
+                    last_name = rnd.choice(LAST_NAMES)
+                    email = f"{first_name}.{last_name}.{i}@example.com".lower()
+                    prospect_id = first_prospect + u * prospects + i
+                    file_id = file_of(u, i)
+                    yield prospect_id, email, first_name, last_name, user_id, file_id
+
+        def campaign_rows() -> Iterator[Tuple]:
+            for u, user_id in enumerate(user_ids):
+                for c in range(campaigns):
+                    campaign_id = first_campaign + u * campaigns + c
+                    yield campaign_id, f"Campaign {c + 1}", user_id, members
+
+        def member_rows() -> Iterator[Tuple]:
+            for u in range(users):
+                rnd = random.Random(f"{seed}-members-{u}")
+                for c in range(campaigns):
+                    campaign_id = first_campaign + u * campaigns + c
+                    for i in sorted(rnd.sample(range(prospects), members)):
+                        yield campaign_id, first_prospect + u * prospects + i
+
+        print("-- Generating Data --")
+        tables = [
+            (
+                "users",
+                "id, email, password_digest, prospects_count, campaigns_count",
+                user_rows(),
+            ),
+            (
+                "files",
+                "id, user_id, filename, file_size, total_rows, done_rows,"
+                " inserted_rows, updated_rows, skipped_rows, invalid_rows,"
+                " duplicate_rows",
+                file_rows(),
+            ),
+            (
+                "prospects",
+                "id, email, first_name, last_name, user_id, file_id",
+                prospect_rows(),
+            ),
+            ("campaigns", "id, name, user_id, prospects_count", campaign_rows()),
+            ("campaigns_prospects", "campaign_id, prospect_id", member_rows()),
+        ]
+        rebuild = []
+        if not keep_indexes:
+            rebuild = drop_indexes(cursor, [table for table, _, _ in tables])
+        for table, columns, rows in tables:
+            print(f"...{table}: {copy_rows(cursor, table, columns, rows)} rows")
+        if rebuild:
+            print("...rebuilding indexes and foreign keys")
+        for statement in rebuild:
+            cursor.execute(statement)
+        cursor.execute(
+            "UPDATE files SET done_at = uploaded_at WHERE id BETWEEN %s AND %s",
+            (first_file, first_file + users * files - 1),
+        )
+        # Fresh statistics, so the planner sees the new volumes right away.
+        cursor.execute("ANALYZE")
+        conn.commit()
+        return user_ids
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument(
+        "--prospects", type=int, default=100000, help="prospects per user"
+    )
+    parser.add_argument("--campaigns", type=int, default=100, help="campaigns per user")
+    parser.add_argument(
+        "--density",
+        type=float,
+        default=0.1,
+        help="share of the user's prospects in each campaign",
+    )
+    parser.add_argument("--files", type=int, default=10, help="import files per user")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--email-format",
+        default="user{n}@example.com",
+        help="emails of the users, {n} being their number",
+    )
+    parser.add_argument(
+        "--keep-indexes",
+        action="store_true",
+        help="maintain indexes while loading, without locking the tables",
+    )
+    args = parser.parse_args()
+
+    generate_data(
+        args.users,
+        args.prospects,
+        args.campaigns,
+        args.density,
+        args.files,
+        args.seed,
+        args.email_format,
+        args.keep_indexes,
+    )
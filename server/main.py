@@ -1,27 +1,36 @@
 #!/usr/bin/python3
 
-import sqlalchemy
+import os
+import shutil
+import tempfile
 
-from dotenv import dotenv_values
 from fastapi import FastAPI
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.responses import JSONResponse
 
+from api.core import metrics
 from api.routers import auth, users, campaigns, prospects
+from api.routers import metrics as metrics_router
 
 
-config = dotenv_values(".env")
-
 app = FastAPI(
     title="Sales Automation - Python (FastAPI)",
     description="Sales Automation Work Simulation",
     version="0.0.1",
 )
 
+app.add_middleware(metrics.MetricsMiddleware)
+
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(campaigns.router)
 app.include_router(prospects.router)
+app.include_router(metrics_router.router)
+
+
+@app.on_event("shutdown")
+def shutdown():
+    metrics.mark_process_dead()
 
 
 @app.exception_handler(StarletteHTTPException)
@@ -31,10 +40,15 @@ async def custom_http_exception_handler(_, exc):
 
 if __name__ == "__main__":
     import uvicorn
-    from api.database import Base
 
-    engine = sqlalchemy.create_engine(config.get("DATABASE_URL"))
-    Base.metadata.create_all(engine)
+    # Each worker process writes its metrics to this folder, so whichever one
+    # serves /metrics reports the total. Start from an empty folder every time.
+    metrics_dir = os.environ.setdefault(
+        metrics.MULTIPROC_DIR_ENV,
+        os.path.join(tempfile.gettempdir(), "sales_automation_metrics"),
+    )
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
 
     uvicorn.run(
         "main:app",
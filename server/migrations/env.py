@@ -0,0 +1,28 @@
+from logging.config import fileConfig
+
+from alembic import context
+
+from api import models  # noqa: F401, registers the tables on Base.metadata
+from api.database import Base, engine
+
+if context.config.config_file_name is not None:
+    fileConfig(context.config.config_file_name)
+
+
+def run_migrations():
+    """Migrate the database of DATABASE_URL, each migration in its own
+    transaction so that migrations can step out of it to build indexes
+    concurrently"""
+    with engine.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=Base.metadata,
+            transaction_per_migration=True,
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    raise SystemExit("Migrations inspect the database and can only run online")
+run_migrations()
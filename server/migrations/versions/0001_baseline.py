@@ -0,0 +1,97 @@
+"""Baseline: the schema db_init.py created before migrations
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def timestamps():
+    return (
+        sa.Column(
+            "created_at", sa.DateTime(timezone=True), server_default=sa.func.now()
+        ),
+        sa.Column(
+            "updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()
+        ),
+    )
+
+
+def upgrade():
+    op.create_table(
+        "users",
+        sa.Column("id", sa.BigInteger, primary_key=True),
+        sa.Column("email", sa.String, nullable=False),
+        sa.Column("password_digest", sa.String, nullable=False),
+        *timestamps(),
+    )
+    op.create_index("ix_users_id", "users", ["id"])
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+    op.create_index(
+        "ix_users_password_digest", "users", ["password_digest"], unique=True
+    )
+
+    op.create_table(
+        "files",
+        sa.Column("id", sa.BigInteger, primary_key=True, autoincrement=True),
+        sa.Column(
+            "user_id", sa.BigInteger, sa.ForeignKey("users.id"), primary_key=True
+        ),
+        sa.Column("filename", sa.String, nullable=False),
+        sa.Column("file_size", sa.BigInteger, nullable=False),
+        sa.Column("total_rows", sa.Integer, nullable=False),
+        sa.Column("done_rows", sa.Integer),
+        sa.Column(
+            "uploaded_at", sa.DateTime(timezone=True), server_default=sa.func.now()
+        ),
+        sa.Column("done_at", sa.DateTime(timezone=True), nullable=True),
+        sa.UniqueConstraint("id"),
+    )
+    op.create_index("ix_files_filename", "files", ["filename"])
+
+    op.create_table(
+        "prospects",
+        sa.Column("id", sa.BigInteger, primary_key=True, autoincrement=True),
+        sa.Column("email", sa.String, primary_key=True, nullable=False),
+        sa.Column("first_name", sa.String, nullable=False),
+        sa.Column("last_name", sa.String, nullable=False),
+        sa.Column(
+            "user_id", sa.BigInteger, sa.ForeignKey("users.id"), primary_key=True
+        ),
+        sa.Column("file_id", sa.BigInteger, sa.ForeignKey("files.id")),
+        *timestamps(),
+        sa.UniqueConstraint("id"),
+    )
+    op.create_index("ix_prospects_first_name", "prospects", ["first_name"])
+    op.create_index("ix_prospects_last_name", "prospects", ["last_name"])
+
+    op.create_table(
+        "campaigns",
+        sa.Column("id", sa.BigInteger, primary_key=True, autoincrement=True),
+        sa.Column("name", sa.String, primary_key=True),
+        sa.Column(
+            "user_id", sa.BigInteger, sa.ForeignKey("users.id"), primary_key=True
+        ),
+        *timestamps(),
+        sa.UniqueConstraint("id"),
+    )
+
+    op.create_table(
+        "campaigns_prospects",
+        sa.Column("id", sa.BigInteger, primary_key=True, autoincrement=True),
+        sa.Column("campaign_id", sa.BigInteger, sa.ForeignKey("campaigns.id")),
+        sa.Column("prospect_id", sa.BigInteger, sa.ForeignKey("prospects.id")),
+    )
+
+
+def downgrade():
+    for table in ("campaigns_prospects", "campaigns", "prospects", "files", "users"):
+        op.drop_table(table)
@@ -0,0 +1,138 @@
+"""Import jobs, chunked uploads, counters and search extensions
+
+Databases created with db_init.py after the baseline may already have any of
+these, so every step is skipped when its object exists.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects.postgresql import JSONB
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+FILE_COUNTERS = (
+    "inserted_rows",
+    "updated_rows",
+    "skipped_rows",
+    "invalid_rows",
+    "duplicate_rows",
+)
+
+
+def columns(table: str) -> set:
+    return {column["name"] for column in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def add_counter(table: str, column: str, count_query: str):
+    """Add a maintained counter to the table and fill it with count_query, which
+    counts rows per id"""
+    if column in columns(table):
+        return
+    op.add_column(
+        table,
+        sa.Column(column, sa.BigInteger, nullable=False, server_default="0"),
+    )
+    op.execute(
+        f"UPDATE {table} SET {column} = counts.count"
+        f" FROM ({count_query}) AS counts WHERE {table}.id = counts.id"
+    )
+
+
+def upgrade():
+    # Trigram indexes (pg_trgm) combined with the user id (btree_gin) back the
+    # substring searches.
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+
+    add_counter(
+        "users",
+        "prospects_count",
+        "SELECT user_id AS id, count(*) FROM prospects GROUP BY user_id",
+    )
+    add_counter(
+        "users",
+        "campaigns_count",
+        "SELECT user_id AS id, count(*) FROM campaigns GROUP BY user_id",
+    )
+    add_counter(
+        "campaigns",
+        "prospects_count",
+        "SELECT campaign_id AS id, count(DISTINCT prospect_id)"
+        " FROM campaigns_prospects GROUP BY campaign_id",
+    )
+
+    existing = columns("files")
+    for column in FILE_COUNTERS:
+        if column not in existing:
+            # Existing files start at 0; new ones get their default from the
+            # model.
+            op.add_column("files", sa.Column(column, sa.Integer, server_default="0"))
+            op.alter_column("files", column, server_default=None)
+    if "content_hash" not in existing:
+        op.add_column("files", sa.Column("content_hash", sa.String, nullable=True))
+
+    tables = sa.inspect(op.get_bind()).get_table_names()
+    if "import_jobs" not in tables:
+        op.create_table(
+            "import_jobs",
+            sa.Column("id", sa.BigInteger, primary_key=True, autoincrement=True),
+            sa.Column(
+                "user_id", sa.BigInteger, sa.ForeignKey("users.id"), nullable=False
+            ),
+            sa.Column(
+                "file_id", sa.BigInteger, sa.ForeignKey("files.id"), nullable=False
+            ),
+            sa.Column("path", sa.String, nullable=False),
+            sa.Column("options", JSONB, nullable=False),
+            sa.Column("status", sa.String, nullable=False),
+            sa.Column("attempts", sa.Integer, nullable=False),
+            sa.Column("error", sa.String, nullable=True),
+            sa.Column(
+                "created_at", sa.DateTime(timezone=True), server_default=sa.func.now()
+            ),
+            sa.Column(
+                "updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()
+            ),
+            sa.Column("heartbeat_at", sa.DateTime(timezone=True), nullable=True),
+        )
+        op.create_index("ix_import_jobs_status", "import_jobs", ["status"])
+    if "uploads" not in tables:
+        op.create_table(
+            "uploads",
+            sa.Column("id", sa.BigInteger, primary_key=True, autoincrement=True),
+            sa.Column(
+                "user_id", sa.BigInteger, sa.ForeignKey("users.id"), nullable=False
+            ),
+            sa.Column("filename", sa.String, nullable=False),
+            sa.Column("size", sa.BigInteger, nullable=False),
+            sa.Column("received", sa.BigInteger, nullable=False),
+            sa.Column("checksum", sa.String, nullable=True),
+            sa.Column("path", sa.String, nullable=False),
+            sa.Column(
+                "file_id", sa.BigInteger, sa.ForeignKey("files.id"), nullable=True
+            ),
+            sa.Column(
+                "created_at", sa.DateTime(timezone=True), server_default=sa.func.now()
+            ),
+            sa.Column(
+                "updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()
+            ),
+        )
+        op.create_index("ix_uploads_user_id", "uploads", ["user_id"])
+
+
+def downgrade():
+    op.drop_table("uploads")
+    op.drop_table("import_jobs")
+    for column in FILE_COUNTERS + ("content_hash",):
+        op.drop_column("files", column)
+    op.drop_column("campaigns", "prospects_count")
+    op.drop_column("users", "campaigns_count")
+    op.drop_column("users", "prospects_count")
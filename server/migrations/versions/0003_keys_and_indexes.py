@@ -0,0 +1,221 @@
+"""Key prospects, campaigns and files by id, and index the hot queries
+
+Runs online: indexes are built with CREATE INDEX CONCURRENTLY, and keys are
+swapped with short locks, using indexes built beforehand and foreign keys
+validated afterwards without blocking writes. Databases created with
+db_init.py after the baseline may already have some of the indexes, which are
+then skipped.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+
+from typing import List
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+# Tables keyed on (id, ...) with a separate UNIQUE (id), keyed on id alone.
+REKEYED_TABLES = ("prospects", "campaigns", "files")
+
+# Indexes of the hot queries in api/crud, by name.
+INDEXES = {
+    # Bulk imports upsert on it; one prospect per user and email.
+    "uq_prospects_user_id_email": "UNIQUE INDEX ON prospects (user_id, email)",
+    # Keyset pagination, counting and exporting a user's prospects.
+    "ix_prospects_user_id_id": "INDEX ON prospects (user_id, id)",
+    # Selecting and exporting the prospects of an import.
+    "ix_prospects_user_id_file_id": "INDEX ON prospects (user_id, file_id)",
+    **{
+        f"ix_prospects_user_id_{column}_trgm": (
+            f"INDEX ON prospects USING gin (user_id, {column} gin_trgm_ops)"
+        )
+        for column in ("email", "first_name", "last_name")
+    },
+    "ix_campaigns_user_id_id": "INDEX ON campaigns (user_id, id)",
+    "ix_campaigns_user_id_name_trgm": (
+        "INDEX ON campaigns USING gin (user_id, name gin_trgm_ops)"
+    ),
+    # Adding prospects to campaigns upserts on it; a prospect is in a campaign
+    # at most once.
+    "uq_campaigns_prospects_campaign_id_prospect_id": (
+        "UNIQUE INDEX ON campaigns_prospects (campaign_id, prospect_id)"
+    ),
+    # Deleting prospects, which checks their campaign links.
+    "ix_campaigns_prospects_prospect_id": "INDEX ON campaigns_prospects (prospect_id)",
+    # Finding earlier uploads of the same content.
+    "ix_files_user_id_content_hash": "INDEX ON files (user_id, content_hash)",
+    "ix_import_jobs_file_id": "INDEX ON import_jobs (file_id)",
+}
+
+# Unique indexes turned into constraints, the targets of ON CONFLICT clauses.
+UNIQUE_CONSTRAINTS = {
+    "prospects": "uq_prospects_user_id_email",
+    "campaigns_prospects": "uq_campaigns_prospects_campaign_id_prospect_id",
+}
+
+
+def scalar(query: str, **params):
+    return op.get_bind().execute(sa.text(query), params).scalar()
+
+
+def create_index_concurrently(name: str, definition: str):
+    """Build the index without blocking writes, unless it already exists. An
+    invalid index left by an interrupted build is dropped and built again."""
+    if scalar(
+        "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)",
+        name=name,
+    ):
+        op.execute(f"DROP INDEX CONCURRENTLY {name}")
+    kind, table_and_columns = definition.split(" ON ", 1)
+    op.execute(
+        f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON {table_and_columns}"
+    )
+
+
+def constraint_exists(table: str, name: str) -> bool:
+    return bool(
+        scalar(
+            "SELECT 1 FROM pg_constraint"
+            " WHERE conrelid = CAST(:table AS regclass) AND conname = :name",
+            table=table,
+            name=name,
+        )
+    )
+
+
+def primary_key_columns(table: str) -> List[str]:
+    return sa.inspect(op.get_bind()).get_pk_constraint(table)["constrained_columns"]
+
+
+def referencing_foreign_keys(table: str) -> List[tuple]:
+    """(table, name, definition) of the foreign keys referencing the table"""
+    return (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid)"
+                " FROM pg_constraint"
+                " WHERE confrelid = CAST(:table AS regclass) AND contype = 'f'"
+            ),
+            {"table": table},
+        )
+        .all()
+    )
+
+
+def remove_duplicates():
+    """Merge the duplicate prospects (same user and email) and campaign links
+    that the old keys allowed, which the unique constraints would reject"""
+    if not constraint_exists("prospects", UNIQUE_CONSTRAINTS["prospects"]):
+        # Keep the oldest prospect of each user and email, moving the campaign
+        # links of the others to it.
+        op.execute(
+            "CREATE TEMPORARY TABLE duplicate_prospects ON COMMIT DROP AS"
+            " SELECT id, min(id) OVER (PARTITION BY user_id, email) AS keep_id"
+            " FROM prospects"
+        )
+        op.execute("DELETE FROM duplicate_prospects WHERE id = keep_id")
+        op.execute(
+            "UPDATE campaigns_prospects SET prospect_id = duplicate_prospects.keep_id"
+            " FROM duplicate_prospects"
+            " WHERE campaigns_prospects.prospect_id = duplicate_prospects.id"
+        )
+    op.execute(
+        "DELETE FROM campaigns_prospects AS duplicate USING campaigns_prospects AS kept"
+        " WHERE duplicate.campaign_id = kept.campaign_id"
+        " AND duplicate.prospect_id = kept.prospect_id AND duplicate.id > kept.id"
+    )
+    if not constraint_exists("prospects", UNIQUE_CONSTRAINTS["prospects"]):
+        op.execute(
+            "DELETE FROM prospects USING duplicate_prospects"
+            " WHERE prospects.id = duplicate_prospects.id"
+        )
+        op.execute(
+            "UPDATE users SET prospects_count = (SELECT count(*) FROM prospects"
+            " WHERE prospects.user_id = users.id)"
+        )
+        op.execute(
+            "UPDATE campaigns SET prospects_count = (SELECT count(*)"
+            " FROM campaigns_prospects"
+            " WHERE campaigns_prospects.campaign_id = campaigns.id)"
+        )
+
+
+def rekey(table: str) -> List[tuple]:
+    """Make id alone the primary key of the table, using the unique index on id
+    built beforehand, and return the foreign keys to validate.
+
+    The foreign keys referencing the table depend on its old UNIQUE (id), so
+    they are recreated NOT VALID, which does not scan the rows.
+    """
+    foreign_keys = referencing_foreign_keys(table)
+    for referencing_table, name, _ in foreign_keys:
+        op.execute(f'ALTER TABLE {referencing_table} DROP CONSTRAINT "{name}"')
+    op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {table}_pkey")
+    op.execute(
+        f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey"
+        f" PRIMARY KEY USING INDEX {table}_id_pkey"
+    )
+    op.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {table}_id_key")
+    for referencing_table, name, definition in foreign_keys:
+        op.execute(
+            f'ALTER TABLE {referencing_table} ADD CONSTRAINT "{name}"'
+            f" {definition} NOT VALID"
+        )
+    return foreign_keys
+
+
+def upgrade():
+    remove_duplicates()
+
+    rekeyed = [
+        table for table in REKEYED_TABLES if primary_key_columns(table) != ["id"]
+    ]
+    with op.get_context().autocommit_block():
+        for name, definition in INDEXES.items():
+            create_index_concurrently(name, definition)
+        for table in rekeyed:
+            create_index_concurrently(
+                f"{table}_id_pkey", f"UNIQUE INDEX ON {table} (id)"
+            )
+
+    for table, name in UNIQUE_CONSTRAINTS.items():
+        if not constraint_exists(table, name):
+            op.execute(
+                f"ALTER TABLE {table} ADD CONSTRAINT {name} UNIQUE USING INDEX {name}"
+            )
+    foreign_keys = [foreign_key for table in rekeyed for foreign_key in rekey(table)]
+
+    # Checking the recreated foreign keys only blocks schema changes.
+    with op.get_context().autocommit_block():
+        for referencing_table, name, _ in foreign_keys:
+            op.execute(f'ALTER TABLE {referencing_table} VALIDATE CONSTRAINT "{name}"')
+
+
+def downgrade():
+    for table in REKEYED_TABLES:
+        columns = {"prospects": "id, email, user_id", "campaigns": "id, name, user_id"}
+        foreign_keys = referencing_foreign_keys(table)
+        op.execute(f"ALTER TABLE {table} ADD CONSTRAINT {table}_id_key UNIQUE (id)")
+        for referencing_table, name, _ in foreign_keys:
+            op.execute(f'ALTER TABLE {referencing_table} DROP CONSTRAINT "{name}"')
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {table}_pkey")
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {table}_pkey"
+            f" PRIMARY KEY ({columns.get(table, 'id, user_id')})"
+        )
+        for referencing_table, name, definition in foreign_keys:
+            op.execute(
+                f'ALTER TABLE {referencing_table} ADD CONSTRAINT "{name}" {definition}'
+            )
+    for table, name in UNIQUE_CONSTRAINTS.items():
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+    for name in INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
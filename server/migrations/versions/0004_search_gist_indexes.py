@@ -0,0 +1,81 @@
+"""Rank searches with trigram GiST indexes
+
+The GIN trigram indexes only found the matches of a search, which then all had
+to be scored before the most similar ones could be returned. GiST indexes also
+return them in order of distance (<->), so a search reads only its results.
+btree_gist lets them lead with the user id.
+
+Runs online: the new indexes are built with CREATE INDEX CONCURRENTLY before the
+old ones are dropped.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+# Columns searched by substring, by table.
+SEARCHED_COLUMNS = {
+    "prospects": ("email", "first_name", "last_name"),
+    "campaigns": ("name",),
+}
+
+
+def index_definitions(method: str, suffix: str) -> dict:
+    return {
+        f"ix_{table}_user_id_{column}_{suffix}": (
+            f"INDEX ON {table} USING {method} (user_id, {column} {method}_trgm_ops)"
+        )
+        for table, columns in SEARCHED_COLUMNS.items()
+        for column in columns
+    }
+
+
+GIST_INDEXES = index_definitions("gist", "trgm_gist")
+GIN_INDEXES = index_definitions("gin", "trgm")
+
+
+def create_index_concurrently(name: str, definition: str):
+    """Build the index without blocking writes, unless it already exists. An
+    invalid index left by an interrupted build is dropped and built again."""
+    invalid = (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT NOT indisvalid FROM pg_index"
+                " WHERE indexrelid = to_regclass(:name)"
+            ),
+            {"name": name},
+        )
+        .scalar()
+    )
+    if invalid:
+        op.execute(f"DROP INDEX CONCURRENTLY {name}")
+    kind, table_and_columns = definition.split(" ON ", 1)
+    op.execute(
+        f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON {table_and_columns}"
+    )
+
+
+def replace_indexes(new: dict, old: dict):
+    with op.get_context().autocommit_block():
+        for name, definition in new.items():
+            create_index_concurrently(name, definition)
+        for name in old:
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    replace_indexes(GIST_INDEXES, GIN_INDEXES)
+
+
+def downgrade():
+    replace_indexes(GIN_INDEXES, GIST_INDEXES)
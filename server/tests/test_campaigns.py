@@ -0,0 +1,29 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from api import schemas
+from api.dependencies.auth import get_current_user
+from api.dependencies.db import get_async_db
+from main import app
+
+
+@pytest.fixture
+def client():
+    async def no_db():
+        yield None
+
+    app.dependency_overrides[get_current_user] = lambda: schemas.User(
+        id=1, email="user@example.com", created_at=0, updated_at=0
+    )
+    app.dependency_overrides[get_async_db] = no_db
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize("action", ["bulk_add", "bulk_remove"])
+@pytest.mark.parametrize("query", ["", "  ", "ab", " ab "])
+def test_bulk_selector_rejects_short_queries(client, action, query):
+    response = client.post(
+        f"/api/campaigns/1/prospects/{action}", json={"query": query}
+    )
+    assert response.status_code == 422
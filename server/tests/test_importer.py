@@ -0,0 +1,126 @@
+from types import SimpleNamespace
+
+import pytest
+
+from api.core import importer
+
+INDEXES = {"email": 0, "first_name": 1, "last_name": 2}
+
+# Quoted values spanning lines, escaped quotes, delimiters within quotes, stray
+# quotes within unquoted values and after closing quotes, and CRLF line breaks.
+ROWS = [
+    'a{i}@example.com,O"Brien,Smith',
+    'b{i}@example.com,"Multi\nline ""{i}""",x',
+    'c{i}@example.com,"Comma, inside","closed"junk"',
+    'd{i}@example.com,Stray",Quote"\r',
+    'not an email,"\n",',
+]
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "prospects.csv"
+    lines = ["email,first_name,last_name"]
+    lines += [row.format(i=i) for i in range(30) for row in ROWS]
+    path.write_bytes("\n".join(lines).encode())
+    return str(path)
+
+
+@pytest.mark.parametrize("size", [1, 10, 100, 1000, 10**6])
+def test_split_csv_ranges_parse_like_sequential(csv_path, size):
+    expected = list(
+        importer.iter_prospects(importer.iter_csv_rows(csv_path), INDEXES, True)
+    )
+    ranges = list(importer.split_csv_ranges(csv_path, size))
+
+    assert ranges[0][0] == 0
+    assert all(end == start for (_, end), (start, _) in zip(ranges, ranges[1:]))
+    prospects = []
+    for start, end in ranges:
+        prospects += importer.parse_csv_range(csv_path, start, end, INDEXES, start == 0)
+    assert prospects == expected
+    assert len(prospects) == len(ROWS) * 30
+
+
+def test_iter_prospects_parallel(csv_path, monkeypatch):
+    monkeypatch.setattr(importer, "IMPORT_PARSE_RANGE_SIZE", 50)
+    expected = importer.iter_prospects(importer.iter_csv_rows(csv_path), INDEXES, True)
+
+    prospects = importer.iter_prospects_parallel(csv_path, INDEXES, True, 2)
+
+    assert list(prospects) == list(expected)
+
+
+def test_split_empty_csv(tmp_path):
+    path = tmp_path / "empty.csv"
+    path.write_bytes(b"")
+    assert list(importer.split_csv_ranges(str(path), 10)) == []
+
+
+class FakeProspects:
+    """In-memory stand-in for the crud calls of import_prospects: prospects by
+    email, with the id of the file they were last written from"""
+
+    def __init__(self, file_ids: dict):
+        self.file_ids = dict(file_ids)
+        self.progress = {}
+
+    def get_file(self, db, user_id, file_id):
+        return SimpleNamespace(done_at=None, done_rows=0)
+
+    def get_existing_emails(self, db, user_id, emails):
+        return {
+            email: self.file_ids[email] for email in emails if email in self.file_ids
+        }
+
+    def upsert_prospects(self, db, user_id, file_id, prospects, force=False):
+        inserted = updated = 0
+        for prospect in prospects:
+            if prospect["email"] not in self.file_ids:
+                inserted += 1
+            elif force:
+                updated += 1
+            else:
+                continue
+            self.file_ids[prospect["email"]] = file_id
+        return inserted, updated
+
+    def advance_file_progress(self, db, user_id, file_id, data):
+        for key, value in data.items():
+            self.progress[key] = self.progress.get(key, 0) + value
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 3, 10])
+@pytest.mark.parametrize("force", [False, True])
+def test_import_counts_do_not_depend_on_batches(
+    tmp_path, monkeypatch, batch_size, force
+):
+    path = tmp_path / "prospects.csv"
+    # The repeat of old@example.com lands in a later batch for small batches.
+    path.write_text("old@example.com,A,B\nnew@example.com,C,D\nold@example.com,E,F\n")
+    store = FakeProspects({"old@example.com": 1})
+    for name in ("get_existing_emails", "upsert_prospects"):
+        monkeypatch.setattr(importer.ProspectCrud, name, getattr(store, name))
+    monkeypatch.setattr(importer.FileCrud, "get_file", store.get_file)
+    monkeypatch.setattr(
+        importer.FileCrud, "advance_file_progress", store.advance_file_progress
+    )
+    monkeypatch.setattr(importer.FileCrud, "update_file_done_at", lambda *args: None)
+
+    importer.import_prospects(
+        None,
+        user_id=1,
+        file_id=2,
+        path=str(path),
+        indexes=INDEXES,
+        has_headers=False,
+        force=force,
+        batch_size=batch_size,
+        parse_processes=0,
+    )
+
+    assert store.progress["done_rows"] == 3
+    assert store.progress["inserted_rows"] == 1
+    assert store.progress["updated_rows"] == (1 if force else 0)
+    assert store.progress["skipped_rows"] == (0 if force else 1)
+    assert store.progress["duplicate_rows"] == 1
@@ -0,0 +1,24 @@
+import pytest
+from fastapi import HTTPException
+
+from api.core.constants import IMPORT_KEEP_FIRST, IMPORT_KEEP_LAST
+from api.dependencies.imports import get_import_options
+
+
+@pytest.mark.parametrize(
+    "force, duplicates, expected",
+    [
+        (False, None, IMPORT_KEEP_FIRST),
+        (True, None, IMPORT_KEEP_LAST),
+        (True, IMPORT_KEEP_FIRST, IMPORT_KEEP_FIRST),
+        (False, IMPORT_KEEP_LAST, IMPORT_KEEP_LAST),
+    ],
+)
+def test_duplicates_default_depends_on_force(force, duplicates, expected):
+    options = get_import_options(0, force=force, duplicates=duplicates)
+    assert options["duplicates"] == expected
+
+
+def test_duplicates_must_be_first_or_last():
+    with pytest.raises(HTTPException):
+        get_import_options(0, duplicates="both")
@@ -0,0 +1,33 @@
+from api import schemas
+from api.core import progress
+
+
+def event(done: int) -> schemas.FileProgressEvent:
+    return schemas.FileProgressEvent(
+        file_id=1,
+        total=100,
+        done=done,
+        inserted=done,
+        updated=0,
+        skipped=0,
+        invalid=0,
+        duplicates=0,
+        done_at=None,
+    )
+
+
+def test_streams_estimate_rates_on_their_own_copy(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(progress.time, "monotonic", lambda: now[0])
+    early, late = progress.ProgressRate(), progress.ProgressRate()
+    early.update(event(0))
+    now[0] = 5.0
+    late.update(event(0))
+
+    now[0] = 10.0
+    shared = event(20)
+    early_event, late_event = early.update(shared), late.update(shared)
+
+    assert (early_event.rate, late_event.rate) == (2.0, 4.0)
+    assert (early_event.eta, late_event.eta) == (40.0, 20.0)
+    assert shared.rate is None and shared.eta is None
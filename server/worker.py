@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import time
+import traceback
+from multiprocessing import Process
+
+from sqlalchemy.orm.session import Session
+
+from api.core import importer
+from api.core.config import settings
+from api.core.constants import IMPORT_JOB_FAILED, IMPORT_KEEP_FIRST
+from api.crud import ImportJobCrud, UploadCrud
+from api.database import SessionLocal, engine
+from api.models import ImportJob
+
+
+def run_job(db: Session, job: ImportJob):
+    """Import the spooled file of a claimed job"""
+    importer.import_prospects(
+        db,
+        job.user_id,
+        job.file_id,
+        job.path,
+        job.options["indexes"],
+        job.options["has_headers"],
+        job.options["force"],
+        # Jobs queued before the option existed kept the first duplicate.
+        job.options.get("duplicates", IMPORT_KEEP_FIRST),
+        on_batch=lambda: ImportJobCrud.heartbeat(db, job),
+    )
+    ImportJobCrud.mark_done(db, job)
+    os.remove(job.path)
+
+
+def run_worker():
+    """Claim and run import jobs until the process is stopped"""
+    # Never share connections inherited from a parent process.
+    engine.dispose()
+    print(f"-- Import worker {os.getpid()} started --")
+    while True:
+        db = SessionLocal()
+        try:
+            job = ImportJobCrud.claim_next(
+                db,
+                settings.IMPORT_JOB_STALE_SECONDS,
+                settings.IMPORT_JOB_MAX_ATTEMPTS,
+            )
+            if not job:
+                paths = ImportJobCrud.fail_abandoned(
+                    db,
+                    settings.IMPORT_JOB_STALE_SECONDS,
+                    settings.IMPORT_JOB_MAX_ATTEMPTS,
+                )
+                paths += UploadCrud.delete_expired(db, settings.UPLOAD_EXPIRE_SECONDS)
+                for path in paths:
+                    if os.path.exists(path):
+                        os.remove(path)
+                time.sleep(settings.IMPORT_WORKER_POLL_SECONDS)
+                continue
+
+            print(f"...importing file {job.file_id} (job {job.id})")
+            try:
+                run_job(db, job)
+            except Exception:
+                db.rollback()
+                traceback.print_exc()
+                ImportJobCrud.mark_failed(
+                    db, job, traceback.format_exc(), settings.IMPORT_JOB_MAX_ATTEMPTS
+                )
+                # Out of attempts: nothing will read the spooled file again.
+                if job.status == IMPORT_JOB_FAILED and os.path.exists(job.path):
+                    os.remove(job.path)
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    args = sys.argv
+    num_workers = int(args[1]) if len(args) > 1 else 1
+
+    if num_workers == 1:
+        run_worker()
+    else:
+        workers = [Process(target=run_worker) for _ in range(num_workers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()